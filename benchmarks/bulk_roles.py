@@ -0,0 +1,116 @@
+"""Runs a bulk role job against a local fake of Discord's member role endpoint.
+
+The fake enforces a fixed window rate limit per guild and answers with the
+same headers Discord sends. The job goes through a real discord.py
+HTTPClient pointed at it, as the bot's does, so this shows how close the
+two together get to the limit and how often they trip it.
+
+Run from the repo root:
+    python -m benchmarks.bulk_roles --members 2000 --limit 10 --window 1
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+
+import discord
+from aiohttp import web
+
+from utils.bulkroles import BulkRoleJob, RoleClient
+
+class FakeDiscord:
+    def __init__(self, limit, window, fail_every=0):
+        self.limit = limit
+        self.window = window
+        self.fail_every = fail_every
+        self.window_start = 0.0
+        self.used = 0
+        self.ok = 0
+        self.limited = 0
+        self.members = set()
+
+    async def handle(self, request):
+        now = time.monotonic()
+        if now - self.window_start >= self.window:
+            self.window_start = now
+            self.used = 0
+        # Rounded up to the millisecond like Discord's, so waiting it out is always enough
+        reset_after = math.ceil((self.window - (now - self.window_start)) * 1000) / 1000
+        if self.used >= self.limit:
+            self.limited += 1
+            # discord.py takes a 429 without Via for a Cloudflare ban
+            return json_response({'message': 'You are being rate limited.', 'retry_after': reset_after, 'global': False},
+                status=429, headers={'Retry-After': f'{reset_after:.3f}', 'Via': '1.1 google',
+                'X-RateLimit-Limit': str(self.limit), 'X-RateLimit-Remaining': '0',
+                'X-RateLimit-Reset-After': f'{reset_after:.3f}', 'X-RateLimit-Bucket': 'roles'})
+        self.used += 1
+        headers = {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(self.limit - self.used),
+            'X-RateLimit-Reset-After': f'{reset_after:.3f}',
+            'X-RateLimit-Bucket': 'roles',
+        }
+        user_id = int(request.match_info['user_id'])
+        if self.fail_every and user_id % self.fail_every == 0:
+            return json_response({'message': 'Unknown Member', 'code': 10007}, status=404, headers=headers)
+        self.ok += 1
+        if request.method == 'PUT':
+            self.members.add(user_id)
+        else:
+            self.members.discard(user_id)
+        return web.Response(status=204, headers=headers)
+
+    async def me(self, request):
+        # What HTTPClient.static_login checks the token with
+        return json_response({'id': '1', 'username': 'bench', 'discriminator': '0', 'avatar': None})
+
+def json_response(data, status=200, headers=None):
+    # discord.py only parses a body whose Content-Type is exactly application/json, no charset
+    headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+    return web.Response(body=json.dumps(data).encode('utf-8'), status=status, headers=headers)
+
+async def main(args):
+    fake = FakeDiscord(args.limit, args.window, args.fail_every)
+    app = web.Application()
+    route = '/api/v10/guilds/{guild_id}/members/{user_id}/roles/{role_id}'
+    app.router.add_route('PUT', route, fake.handle)
+    app.router.add_route('DELETE', route, fake.handle)
+    app.router.add_get('/api/v10/users/@me', fake.me)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    discord.http.Route.BASE = f'http://127.0.0.1:{port}/api/v10'
+    http = discord.http.HTTPClient(asyncio.get_running_loop())
+    await http.static_login('fake-token')
+    try:
+        job = BulkRoleJob(RoleClient(http), 1, 2, True, list(range(1, args.members + 1)), concurrency=args.concurrency)
+
+        async def on_progress(job):
+            eta = f'{job.eta:.0f}s' if job.eta is not None else '?'
+            print(f'  {job.handled}/{len(job.member_ids)} ({job.rate:.1f}/s, ETA {eta}, cursor {job.cursor})')
+
+        start = time.perf_counter()
+        await job.run(on_progress, interval=args.interval)
+        elapsed = time.perf_counter() - start
+    finally:
+        await http.close()
+    await runner.cleanup()
+
+    ceiling = args.limit / args.window
+    print(f'{job.done} done, {job.failed} failed in {elapsed:.1f}s: {job.handled / elapsed:.1f}/s '
+        f'against a limit of {ceiling:.1f}/s ({job.handled / elapsed / ceiling:.0%})')
+    print(f'429s served: {fake.limited}, members holding the role: {len(fake.members)}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=2000)
+    parser.add_argument('--limit', type=int, default=10, help='requests per window')
+    parser.add_argument('--window', type=float, default=1.0, help='window length in seconds')
+    parser.add_argument('--concurrency', type=int, default=5)
+    parser.add_argument('--fail-every', type=int, default=0, help='answer 404 for every nth member')
+    parser.add_argument('--interval', type=float, default=2.0, help='seconds between progress reports')
+    asyncio.run(main(parser.parse_args()))
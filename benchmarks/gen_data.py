@@ -0,0 +1,139 @@
+"""Fills a main.sqlite-shaped database with a large, skewed synthetic data set.
+
+A few guilds are huge and most are tiny (Zipf over `--guilds`), both for tags
+and for moderation. Within a guild a handful of tags get nearly all the uses,
+a few repeat offenders collect most of the warnings, and a couple of mods do
+most of the moderating. Warnings are spread over the last `--days` days,
+weighted towards recent ones. Some guilds get a custom prefix or mute role.
+
+The schema is built by the real migrations, so the result is what a bot on
+this commit would be running against. Point benchmarks.storage at it.
+`legacy_tables` refills the same rows into the tables as they were before
+the migrations, that's storage's `legacy` layout.
+
+Run from the repo root:
+    python -m benchmarks.gen_data bench.sqlite --guilds 5000 --tags 2000000 --warnings 2000000
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import time
+
+from benchmarks.tag_grep import vocabulary
+from utils.db import Database
+from utils.migrations import _legacy_tables, migrate, rebuild_tag_search
+from utils.modlog import rebuild_mod_stats
+
+# Insert batch, one group commit each
+CHUNK = 50000
+
+# Roughly what the mod commands log, most of it warns
+MOD_TYPES = {'Warn': 50, 'Mute': 12, 'Tempmute': 10, 'Unmute': 8, 'Kick': 8, 'Ban': 6, 'Tempban': 4, 'Softban': 2}
+
+PREFIXES = ('!', '?', '$', '>', ',', 'm.', 'mollie ', ';;')
+
+def zipf(n, s=1.0):
+    """Cumulative weights for ranks 1..n, for random.choices."""
+    return list(itertools.accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+def guild_ids(count, rng):
+    # Snowflake sized and unordered, like the real thing
+    return rng.sample(range(10**17, 10**18), count)
+
+def synthetic_tags(rng, guilds, cum_guilds, count, now):
+    words, weights = vocabulary(rng)
+    cum_words = list(itertools.accumulate(weights))
+    for i in range(count):
+        guild_id = rng.choices(guilds, cum_weights=cum_guilds)[0]
+        name = f'{rng.choices(words, cum_weights=cum_words)[0]}-{i:x}'
+        content = ' '.join(rng.choices(words, cum_weights=cum_words, k=rng.randint(5, 80)))
+        # Heavy tail, most tags are barely used and a few are used constantly
+        uses = int(rng.paretovariate(1.1)) - 1
+        created = time.strftime('%D', time.gmtime(now - rng.randrange(3 * 365 * 86400)))
+        yield (guild_id, rng.randrange(10**17, 10**18), uses, name, content, created)
+
+def synthetic_warnings(rng, guilds, cum_guilds, count, now, days):
+    members = zipf(1000, 1.2)
+    mods = zipf(8, 1.5)
+    types, type_weights = zip(*MOD_TYPES.items())
+    cum_types = list(itertools.accumulate(type_weights))
+    for _ in range(count):
+        guild_id = rng.choices(guilds, cum_weights=cum_guilds)[0]
+        # Member and mod ids derived from the guild so the same people show up again
+        user = rng.choices(range(1000), cum_weights=members)[0]
+        mod = rng.choices(range(8), cum_weights=mods)[0]
+        age = int(rng.expovariate(3 / (days * 86400)))
+        yield (guild_id, guild_id + 1 + user, guild_id + 5000 + mod, rng.choices(types, cum_weights=cum_types)[0],
+            'synthetic reason', now - min(age, days * 86400))
+
+def legacy_tables(cur):
+    """Swaps tags, warnings and guild_settings for the untyped, keyless pre-migration tables, with the same rows."""
+    for table in ('tags', 'warnings', 'guild_settings'):
+        cur.execute(f"ALTER TABLE {table} RENAME TO {table}_current")
+    _legacy_tables(cur)
+    cur.execute('''INSERT INTO tags SELECT guild_id, author_id, uses, name, content, creation
+        FROM tags_current ORDER BY id''')
+    # Warnings were dated with strftime('%D') back then
+    cur.execute('''INSERT INTO warnings SELECT guild_id, user_id, mod_id, mod_type, reason,
+        strftime('%m/%d/%y', created_at, 'unixepoch') FROM warnings_current ORDER BY id''')
+    cur.execute("INSERT INTO guild_settings SELECT guild_id, prefix FROM guild_settings_current")
+
+async def insert(db, sql, rows, total, label):
+    start = time.perf_counter()
+    done = 0
+    while True:
+        chunk = list(itertools.islice(rows, CHUNK))
+        if not chunk:
+            break
+        await db.executemany(sql, chunk)
+        done += len(chunk)
+        print(f'\r{label}: {done}/{total}', end='', flush=True)
+    print(f'\r{label}: {total} in {time.perf_counter() - start:.1f}s')
+
+async def main(args):
+    if os.path.exists(args.path):
+        raise SystemExit(f'{args.path} already exists, pick a new path')
+    rng = random.Random(args.seed)
+    now = int(time.time())
+    db = await Database(args.path).start()
+    await migrate(db)
+
+    guilds = guild_ids(args.guilds, rng)
+    cum_guilds = zipf(len(guilds), args.skew)
+    await insert(db, '''INSERT INTO tags(guild_id, author_id, uses, name, content, creation) VALUES(?,?,?,?,?,?)''',
+        synthetic_tags(rng, guilds, cum_guilds, args.tags, now), args.tags, 'tags')
+    start = time.perf_counter()
+    await db.transaction(rebuild_tag_search)
+    print(f'tag search index: {time.perf_counter() - start:.1f}s')
+
+    # Moderation skews to a different set of guilds than tags do
+    modded = rng.sample(guilds, len(guilds))
+    await insert(db, '''INSERT INTO warnings(guild_id, user_id, mod_id, mod_type, reason, created_at) VALUES(?,?,?,?,?,?)''',
+        synthetic_warnings(rng, modded, cum_guilds, args.warnings, now, args.days), args.warnings, 'warnings')
+    buckets = await db.transaction(rebuild_mod_stats)
+    print(f'mod_stats: {buckets} buckets')
+
+    settings = [(guild_id, rng.choice(PREFIXES) if rng.random() < args.prefixes else None,
+        rng.randrange(10**17, 10**18) if rng.random() < 0.3 else None)
+        for guild_id in guilds if rng.random() < args.settings]
+    await db.executemany("INSERT INTO guild_settings(guild_id, prefix, muterole) VALUES(?,?,?)", settings)
+    print(f'guild_settings: {len(settings)} rows')
+
+    await db.execute('ANALYZE')
+    await db.close()
+    print(f'{args.path}: {os.path.getsize(args.path) / 2**20:.0f} MiB')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='database to create, must not exist yet')
+    parser.add_argument('--guilds', type=int, default=5000)
+    parser.add_argument('--tags', type=int, default=2000000)
+    parser.add_argument('--warnings', type=int, default=2000000)
+    parser.add_argument('--days', type=int, default=730, help='how far back warnings go')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent over guild sizes')
+    parser.add_argument('--settings', type=float, default=0.5, help='fraction of guilds with a guild_settings row')
+    parser.add_argument('--prefixes', type=float, default=0.4, help='fraction of those with a custom prefix')
+    parser.add_argument('--seed', type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
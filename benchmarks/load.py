@@ -0,0 +1,305 @@
+"""Drives a real Mollie instance with synthetic traffic, no Discord involved.
+
+The bot is built as main.py builds it, with every cog loaded, but its HTTP
+client answers from a stub (after an optional fake round trip) and messages
+are fed in as raw MESSAGE_CREATE gateway payloads. Traffic is open loop at
+`--rate` messages a second spread over `--guilds` guilds, mixing prefix
+lookups, tag reads and writes, unknown-command tag fallbacks and moderation
+commands.
+
+A message's latency runs from the moment it is fed in to the end of the last
+HTTP request made while handling it (replies, DMs, role changes...). Results
+go to stdout and, with --out, to a JSON file to compare between commits.
+
+Run from the repo root:
+    python -m benchmarks.load --rate 200 --duration 20 --out load.json
+"""
+import argparse
+import asyncio
+import contextvars
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import discord
+from aiohttp import ClientSession
+
+from main import Mollie, load_modules
+from utils.db import Database
+from utils.migrations import migrate
+
+# Which synthetic message the current task is working on, follows the bot's dispatched tasks
+current = contextvars.ContextVar('current', default=None)
+
+MIX = {
+    'prefix': 1,
+    'tag_read': 6,
+    'tag_fallback': 6,
+    'tag_write': 1,
+    'warn': 1,
+    'modlogs': 1,
+}
+
+_ids = itertools.count(10**17)
+
+def snowflake():
+    return next(_ids)
+
+def user_payload(user_id, name, bot=False):
+    return {'id': str(user_id), 'username': name, 'discriminator': '0', 'global_name': None, 'avatar': None, 'bot': bot}
+
+def member_payload(user=None, roles=()):
+    data = {'roles': [str(r) for r in roles], 'joined_at': '2021-01-01T00:00:00+00:00',
+        'deaf': False, 'mute': False, 'nick': None, 'flags': 0}
+    if user is not None:
+        data['user'] = user
+    return data
+
+class Sample:
+    __slots__ = ('kind', 'start', 'end')
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.start = time.perf_counter()
+        self.end = None
+
+class FakeHTTP:
+    """Stands in for HTTPClient.request, answering each route with a plausible payload."""
+    def __init__(self, me, latency):
+        self.me = me
+        self.latency = latency
+        self.requests = defaultdict(int)
+
+    async def request(self, route, *, files=None, form=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        key = f'{route.method} {route.path}'
+        self.requests[key] += 1
+        sample = current.get()
+        if sample is not None:
+            sample.end = time.perf_counter()
+        payload = kwargs.get('json') or {}
+        if key == 'POST /channels/{channel_id}/messages':
+            return {
+                'id': str(snowflake()), 'channel_id': str(route.channel_id), 'author': self.me,
+                'content': payload.get('content') or '', 'timestamp': discord.utils.utcnow().isoformat(),
+                'edited_timestamp': None, 'tts': False, 'mention_everyone': False, 'mentions': [],
+                'mention_roles': [], 'attachments': [], 'embeds': payload.get('embeds') or [], 'pinned': False, 'type': 0,
+            }
+        if key == 'POST /users/@me/channels':
+            return {'id': str(snowflake()), 'type': 1, 'recipients': [user_payload(payload['recipient_id'], 'someone')]}
+        if key == 'POST /guilds/{guild_id}/roles':
+            return {'id': str(snowflake()), 'name': payload.get('name', 'role'), 'permissions': '0', 'position': 1,
+                'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}
+        if route.method == 'GET' and route.path.endswith('/bans'):
+            return []
+        return None
+
+class LoopLag:
+    """Measures how late a short sleep wakes up, which is how long something else held the loop."""
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {'count': len(values), 'p50_ms': pick(0.5) * 1000, 'p99_ms': pick(0.99) * 1000, 'max_ms': values[-1] * 1000}
+
+class World:
+    """The guilds, members and tags the synthetic traffic is aimed at."""
+    def __init__(self, bot, rng, guilds, members, tags):
+        self.bot = bot
+        self.rng = rng
+        self.guilds = []
+        self.tags = {}
+        self.created = itertools.count()
+        state = bot._connection
+        me = bot.user
+        for g in range(guilds):
+            guild_id = snowflake()
+            owner = user_payload(snowflake(), f'owner{g}')
+            admin_role = snowflake()
+            users = [user_payload(snowflake(), f'member{g}_{i}') for i in range(members)]
+            channels = [{'id': str(snowflake()), 'type': 0, 'name': f'chat{c}', 'position': c,
+                'permission_overwrites': [], 'guild_id': str(guild_id)} for c in range(3)]
+            data = {
+                'id': str(guild_id), 'name': f'guild{g}', 'owner_id': owner['id'], 'member_count': members + 2,
+                'roles': [
+                    {'id': str(guild_id), 'name': '@everyone', 'permissions': str(discord.Permissions.general().value),
+                        'position': 0, 'color': 0, 'hoist': False, 'managed': False, 'mentionable': False},
+                    {'id': str(admin_role), 'name': 'Bot', 'permissions': str(discord.Permissions.all().value),
+                        'position': 10, 'color': 0, 'hoist': False, 'managed': False, 'mentionable': False},
+                ],
+                'channels': channels,
+                'members': [member_payload(owner), member_payload(user_payload(me.id, me.name, bot=True), [admin_role])]
+                    + [member_payload(user) for user in users],
+                'emojis': [], 'stickers': [], 'features': [], 'verification_level': 0,
+            }
+            state._add_guild_from_data(data)
+            self.guilds.append((guild_id, owner, [c['id'] for c in channels], users))
+
+    async def seed_tags(self, db, tags):
+        rows = []
+        for guild_id, owner, _, _ in self.guilds:
+            names = [f'tag{i}' for i in range(tags)]
+            self.tags[guild_id] = names
+            rows += [(guild_id, int(owner['id']), 0, name, f'content of {name} ' * 8, '01/01/21') for name in names]
+        await db.executemany('''INSERT INTO tags(guild_id, author_id, uses, name, content, creation)
+            VALUES(?,?,?,?,?,?)''', rows)
+        await db.execute("INSERT INTO tags_fts(tags_fts) VALUES('rebuild')")
+
+    def content(self, kind, guild_id, users):
+        rng = self.rng
+        if kind == 'prefix':
+            return '.prefix'
+        if kind == 'tag_read':
+            return f'.tag {rng.choice(self.tags[guild_id])}'
+        if kind == 'tag_fallback':
+            return f'.{rng.choice(self.tags[guild_id])}'
+        if kind == 'tag_write':
+            return f'.tag create new{next(self.created)} some fresh tag content'
+        if kind == 'warn':
+            return f'.warn <@{rng.choice(users)["id"]}> spamming'
+        if kind == 'modlogs':
+            return '.modlogs'
+        raise ValueError(kind)
+
+    def message(self, kind):
+        guild_id, owner, channels, users = self.rng.choice(self.guilds)
+        return {
+            'id': str(snowflake()), 'channel_id': self.rng.choice(channels), 'guild_id': str(guild_id),
+            'author': owner, 'member': member_payload(),
+            'content': self.content(kind, guild_id, users), 'timestamp': discord.utils.utcnow().isoformat(),
+            'edited_timestamp': None, 'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [],
+            'attachments': [], 'embeds': [], 'pinned': False, 'type': 0,
+        }
+
+async def build_bot(db, latency):
+    # The session is only there for main.py's close(), nothing goes out through it
+    bot = Mollie(session=ClientSession(), db=db)
+    await bot._async_setup_hook()
+    me = user_payload(snowflake(), 'Mollie', bot=True)
+    bot._connection.user = discord.ClientUser(state=bot._connection, data=me)
+    fake = FakeHTTP(me, latency)
+    bot.http.token = 'fake-token'
+    bot.http.request = fake.request
+    await bot.setup_hook()
+    await load_modules(bot)
+    return bot, fake
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def main(args):
+    rng = random.Random(args.seed)
+    mix = dict(MIX)
+    for item in args.mix or ():
+        kind, _, weight = item.partition('=')
+        mix[kind] = float(weight)
+    kinds, weights = zip(*((k, w) for k, w in mix.items() if w > 0))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = await Database(os.path.join(tmp, 'load.sqlite')).start()
+        await migrate(db)
+        bot, fake = await build_bot(db, args.http_latency / 1000)
+        world = World(bot, rng, args.guilds, args.members, args.tags)
+        await world.seed_tags(db, args.tags)
+        # Tags were seeded behind the cog's back
+        await bot.get_cog('tags').cog_load()
+        parse = bot._connection.parsers['MESSAGE_CREATE']
+
+        samples = []
+        lag = LoopLag()
+        lag.start()
+        total = int(args.rate * args.duration)
+        start = time.perf_counter()
+        for i in range(total):
+            # Open loop: message i goes in at i / rate whether or not the bot has kept up
+            delay = start + i / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            kind = rng.choices(kinds, weights)[0]
+            sample = Sample(kind)
+            samples.append(sample)
+            data = world.message(kind)
+            token = current.set(sample)
+            try:
+                parse(data)
+            finally:
+                current.reset(token)
+        fed = time.perf_counter() - start
+        # Let whatever is still in flight finish
+        deadline = time.perf_counter() + args.drain
+        while time.perf_counter() < deadline:
+            last = max((s.end or 0) for s in samples)
+            if time.perf_counter() - last > 0.5:
+                break
+            await asyncio.sleep(0.1)
+        lag.stop()
+        handled = [s for s in samples if s.end is not None]
+        finished = max(s.end for s in handled) if handled else time.perf_counter()
+        elapsed = finished - start
+
+        by_kind = defaultdict(list)
+        for s in handled:
+            by_kind[s.kind].append(s.end - s.start)
+        result = {
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'discord.py': discord.__version__,
+            'config': {k: v for k, v in vars(args).items() if k != 'out'} | {'mix': mix},
+            'messages': total,
+            'answered': len(handled),
+            'offered_rate': args.rate,
+            'fed_in_s': fed,
+            'messages_per_sec': len(handled) / elapsed if elapsed > 0 else 0.0,
+            'latency': percentiles([s.end - s.start for s in handled]),
+            'latency_by_kind': {kind: percentiles(values) for kind, values in sorted(by_kind.items())},
+            'loop_lag': percentiles(lag.samples),
+            'http_requests': dict(sorted(fake.requests.items())),
+        }
+        await bot.close()
+
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=float, default=200, help='messages per second offered')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of traffic')
+    parser.add_argument('--guilds', type=int, default=50)
+    parser.add_argument('--members', type=int, default=50, help='members per guild')
+    parser.add_argument('--tags', type=int, default=200, help='tags per guild')
+    parser.add_argument('--http-latency', type=float, default=0, help='fake round trip per HTTP request, in ms')
+    parser.add_argument('--mix', nargs='*', metavar='KIND=WEIGHT', help=f'override traffic weights, kinds: {", ".join(MIX)}')
+    parser.add_argument('--drain', type=float, default=10, help='seconds to wait for stragglers')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='also write the results to this JSON file')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,62 @@
+"""Compares SearchRole's role index with the linear scan it replaced.
+
+Run from the repo root:
+    python -m benchmarks.role_lookup --roles 250
+"""
+import argparse
+import random
+import timeit
+from types import SimpleNamespace
+
+from utils.roles import GuildRoles, RoleIndex
+
+WORDS = ('mod admin helper member verified muted vip booster staff owner bot '
+    'red blue green purple pink event giveaway announcements art music gaming '
+    'level trusted partner support dev tester news he/him she/her they/them').split()
+
+def make_guild(rng, count):
+    roles = {}
+    for position in range(count):
+        name = ' '.join(rng.sample(WORDS, rng.randint(1, 3))).title()
+        if rng.random() < 0.3:
+            name += f' {position}'
+        roles[position + 1] = SimpleNamespace(id=position + 1, name=name, position=position)
+    return SimpleNamespace(id=1, _roles=roles, roles=list(roles.values()), get_role=roles.get)
+
+def linear_lookup(guild, argument):
+    # SearchRole.convert before the index
+    result = next((r for r in guild._roles.values() if r.name.lower() == argument.lower()), None)
+    if result is None:
+        for role in guild._roles.values():
+            if argument.lower() in role.name.lower():
+                result = role
+    return result
+
+def main(args):
+    rng = random.Random(args.seed)
+    guild = make_guild(rng, args.roles)
+    names = [role.name for role in guild.roles]
+    queries = {
+        'exact': rng.choice(names),
+        'prefix': rng.choice(names)[:4],
+        'substring': rng.choice(names)[2:6],
+        'miss': 'nothing like this',
+    }
+    index = RoleIndex()
+    index.get(guild)
+    build = min(timeit.repeat(lambda: GuildRoles(guild.roles), number=100, repeat=5)) / 100
+    print(f'{args.roles} roles, index build {build * 1e6:.0f}us (once per role change)')
+    print(f'{"query":<10} {"linear":>10} {"index":>10}  result (linear / index)')
+    for kind, query in queries.items():
+        linear = min(timeit.repeat(lambda: linear_lookup(guild, query), number=args.number, repeat=5)) / args.number
+        indexed = min(timeit.repeat(lambda: index.search(guild, query), number=args.number, repeat=5)) / args.number
+        a, b = linear_lookup(guild, query), index.search(guild, query)
+        print(f'{kind:<10} {linear * 1e6:>8.1f}us {indexed * 1e6:>8.1f}us  '
+            f'{a.name if a else None!r} / {b.name if b else None!r}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--roles', type=int, default=250)
+    parser.add_argument('--number', type=int, default=2000, help='lookups per timing')
+    parser.add_argument('--seed', type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,241 @@
+"""Times the queries the cogs actually issue against a big database, per schema layout.
+
+Each pattern is the cog's own SQL (tag lookup and miss, rank, list page, top,
+random, prefix load and fetch, warning insert, mod log page), run `--iterations`
+times against targets sampled from the data, so big guilds get most of the
+traffic just as they would for real. `tag_lookup_cached` replays a skewed
+stream of lookups through the same LRU cache the tags cog uses and reports
+its hit rate alongside the latency.
+
+A layout is a set of DDL (or functions taking a cursor) applied before
+timing, inside a transaction that is rolled back afterwards, so the database
+(benchmarks.gen_data makes one) is left as it was, warning inserts included.
+Writes are therefore timed without their commit: that's index upkeep, not
+fsync. `--ddl` tries out anything else, e.g.
+`--ddl "CREATE INDEX x ON tags(guild_id, name, content)"`.
+`legacy` is the baseline: the same rows in the untyped, keyless tables from
+before the migrations, with the queries that schema allows where the current
+ones don't fit.
+
+Run from the repo root:
+    python -m benchmarks.storage bench.sqlite --layout current no-rank-index --out storage.json
+"""
+import argparse
+import itertools
+import json
+import random
+import sqlite3
+import sys
+import time
+
+from benchmarks.gen_data import legacy_tables
+from utils.cache import LRUCache
+from utils.modlog import MAX_ID, _insert_actions
+
+LAYOUTS = {
+    'current': [],
+    # Before any migrations, no keys or indexes at all
+    'legacy': [legacy_tables],
+    # What the rank, top and owner indexes are buying
+    'no-rank-index': ['DROP INDEX tags_guild_uses_idx'],
+    'no-tag-indexes': ['DROP INDEX tags_guild_uses_idx', 'DROP INDEX tags_guild_author_name_idx'],
+    # Lookups answered from the index alone, at the cost of a second copy of every tag
+    'covering-lookup': ['CREATE INDEX tags_guild_name_content_idx ON tags(guild_id, name, content)'],
+    # Only the per-member warnings index, as before the mod log pages
+    'one-warning-index': ['DROP INDEX warnings_guild_mod_created_idx', 'DROP INDEX warnings_guild_created_idx'],
+}
+
+# Straight from the cogs, keep in step with them
+QUERIES = {
+    'tag_lookup': "SELECT content FROM tags WHERE name=? AND guild_id=?",
+    'tag_info': "SELECT * FROM tags WHERE name=? AND guild_id=?",
+    'tag_rank': "SELECT COUNT(*) FROM tags WHERE guild_id=? AND uses > ?",
+    'tag_list': "SELECT name FROM tags WHERE guild_id=? AND name > ? ORDER BY name ASC LIMIT ?",
+    'tag_top': "SELECT name, uses FROM tags WHERE guild_id=? ORDER BY uses DESC, name LIMIT ?",
+    'tag_random': "SELECT name FROM tags WHERE guild_id=? ORDER BY RANDOM() LIMIT 1",
+    'prefix_load': "SELECT guild_id, prefix FROM guild_settings WHERE prefix IS NOT NULL",
+    'prefix_fetch': "SELECT prefix FROM guild_settings WHERE guild_id=?",
+    'modlogs': '''SELECT id, user_id, mod_id, mod_type, reason, created_at FROM warnings
+        WHERE guild_id=? AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?''',
+}
+
+# The legacy tables have no id or created_at, and warnings were only ever inserted
+LEGACY_QUERIES = QUERIES | {
+    'modlogs': '''SELECT rowid, user_id, mod_id, mod_type, reason, date FROM warnings
+        WHERE guild_id=? AND rowid < ? ORDER BY rowid DESC LIMIT ?''',
+    'warning_insert': "INSERT INTO warnings VALUES(?,?,?,?,?,?)",
+}
+
+# Same limits as Tags.tag_cache
+CACHE_ENTRIES = 4096
+CACHE_BYTES = 8 * 1024 * 1024
+
+def connect(path):
+    # Same settings as utils.db, but synchronous so only the query is timed
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+def sample_targets(conn, rng, count):
+    """(guild_id, name, uses) of random tags, and guild ids of random warnings."""
+    last_tag = conn.execute("SELECT MAX(id) FROM tags").fetchone()[0] or 0
+    last_warning = conn.execute("SELECT MAX(id) FROM warnings").fetchone()[0] or 0
+    if not last_tag or not last_warning:
+        raise SystemExit('No tags or warnings, fill the database with benchmarks.gen_data first')
+    tags = []
+    while len(tags) < count:
+        row = conn.execute("SELECT guild_id, name, uses FROM tags WHERE id=?", (rng.randint(1, last_tag),)).fetchone()
+        if row is not None:
+            tags.append(row)
+    modded = []
+    while len(modded) < count:
+        row = conn.execute("SELECT guild_id FROM warnings WHERE id=?", (rng.randint(1, last_warning),)).fetchone()
+        if row is not None:
+            modded.append(row[0])
+    return tags, modded
+
+def patterns(tags, modded, rng, args, legacy=False):
+    """name -> [(sql or callable, params)], one entry per iteration."""
+    now = int(time.time())
+    if legacy:
+        date = time.strftime('%D', time.gmtime(now))
+        return patterns(tags, modded, rng, args) | {
+            'modlogs': [(LEGACY_QUERIES['modlogs'], (guild_id, MAX_ID, 10)) for guild_id in modded],
+            'warning_insert': [(LEGACY_QUERIES['warning_insert'], (guild_id, guild_id + 1 + rng.randrange(1000),
+                guild_id + 5000, 'Warn', 'benchmark', date)) for guild_id in modded],
+        }
+    return {
+        'tag_lookup': [(QUERIES['tag_lookup'], (name, guild_id)) for guild_id, name, _ in tags],
+        'tag_miss': [(QUERIES['tag_lookup'], (f'{name}-nope', guild_id)) for guild_id, name, _ in tags],
+        'tag_info': [(QUERIES['tag_info'], (name, guild_id)) for guild_id, name, _ in tags],
+        'tag_rank': [(QUERIES['tag_rank'], (guild_id, uses)) for guild_id, _, uses in tags],
+        # A page from somewhere in the middle of the list
+        'tag_list': [(QUERIES['tag_list'], (guild_id, name, 40)) for guild_id, name, _ in tags],
+        'tag_top': [(QUERIES['tag_top'], (guild_id, 10)) for guild_id, _, _ in tags],
+        'tag_random': [(QUERIES['tag_random'], (guild_id,)) for guild_id, _, _ in tags],
+        # Once per startup, a handful of runs is plenty
+        'prefix_load': [(QUERIES['prefix_load'], ())] * min(args.iterations, 20),
+        'prefix_fetch': [(QUERIES['prefix_fetch'], (guild_id,)) for guild_id, _, _ in tags],
+        'modlogs': [(QUERIES['modlogs'], (guild_id, MAX_ID, MAX_ID, 10)) for guild_id in modded],
+        'warning_insert': [(_insert_actions, ([(guild_id, guild_id + 1 + rng.randrange(1000), guild_id + 5000, 'Warn',
+            'benchmark')], now)) for guild_id in modded],
+    }
+
+def run(conn, entries):
+    times = []
+    cur = conn.cursor()
+    for sql, params in entries:
+        start = time.perf_counter()
+        if callable(sql):
+            sql(cur, *params)
+        else:
+            cur.execute(sql, params).fetchall()
+        times.append(time.perf_counter() - start)
+    return times
+
+def run_cached(conn, tags, rng, count, entries):
+    """Lookups as Tags.get_tag_content makes them, popular tags asked for far more often."""
+    cache = LRUCache(max_entries=entries, max_bytes=CACHE_BYTES, sizeof=lambda c: len(c.encode('utf-8')))
+    pool = sorted(tags, key=lambda t: t[2], reverse=True)
+    cum = list(itertools.accumulate(1 / rank for rank in range(1, len(pool) + 1)))
+    times = []
+    for guild_id, name, _ in rng.choices(pool, cum_weights=cum, k=count):
+        start = time.perf_counter()
+        key = (guild_id, name)
+        if cache.get(key) is None:
+            row = conn.execute(QUERIES['tag_lookup'], (name, guild_id)).fetchone()
+            cache.put(key, row[0])
+        times.append(time.perf_counter() - start)
+    return times, cache.stats['hit_rate']
+
+def summary(times):
+    times = sorted(times)
+    pick = lambda q: times[min(len(times) - 1, int(q * len(times)))] * 10**6
+    return {'runs': len(times), 'p50_us': pick(0.5), 'p99_us': pick(0.99), 'max_us': times[-1] * 10**6,
+        'mean_us': sum(times) / len(times) * 10**6}
+
+def plans(conn, layout, tags):
+    guild_id, name, uses = tags[0]
+    queries = LEGACY_QUERIES if layout == 'legacy' else QUERIES
+    params = {'tag_lookup': (name, guild_id), 'tag_info': (name, guild_id), 'tag_rank': (guild_id, uses),
+        'tag_list': (guild_id, name, 40), 'tag_top': (guild_id, 10), 'tag_random': (guild_id,),
+        'prefix_load': (), 'prefix_fetch': (guild_id,), 'modlogs': (guild_id, MAX_ID, MAX_ID, 10)}
+    if layout == 'legacy':
+        params['modlogs'] = (guild_id, MAX_ID, 10)
+    for pattern, sql in queries.items():
+        if pattern not in params:
+            continue
+        # The comment keeps sqlite3's statement cache from handing back the last layout's plan
+        steps = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql} -- {layout}', params[pattern])]
+        print(f'  {pattern:>16}: {"; ".join(steps)}')
+
+def bench_layout(conn, name, ddl, tags, modded, args):
+    conn.execute('BEGIN')
+    try:
+        start = time.perf_counter()
+        for statement in ddl:
+            if callable(statement):
+                statement(conn.cursor())
+            else:
+                conn.execute(statement)
+        applied = time.perf_counter() - start
+        print(f'{name} (layout applied in {applied:.1f}s)')
+        if args.plans:
+            plans(conn, name, tags)
+        rng = random.Random(args.seed)
+        results = {}
+        for pattern, entries in patterns(tags, modded, rng, args, legacy=name == 'legacy').items():
+            if args.only and pattern not in args.only:
+                continue
+            results[pattern] = summary(run(conn, entries))
+        if not args.only or 'tag_lookup_cached' in args.only:
+            times, hit_rate = run_cached(conn, tags, rng, args.iterations * 5, args.cache_entries)
+            results['tag_lookup_cached'] = summary(times) | {'hit_rate': hit_rate}
+        for pattern, r in results.items():
+            extra = f'  hit rate {r["hit_rate"]:.1%}' if 'hit_rate' in r else ''
+            print(f'  {pattern:>18}: p50 {r["p50_us"]:9.1f}us  p99 {r["p99_us"]:9.1f}us  '
+                f'mean {r["mean_us"]:9.1f}us{extra}')
+        ddl = [getattr(statement, '__name__', statement) for statement in ddl]
+        return {'ddl': ddl, 'applied_s': applied, 'patterns': results}
+    finally:
+        conn.execute('ROLLBACK')
+
+def main(args):
+    conn = connect(args.path)
+    rng = random.Random(args.seed)
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in ('tags', 'warnings', 'guild_settings')}
+    guilds = conn.execute("SELECT COUNT(DISTINCT guild_id) FROM tags").fetchone()[0]
+    print(f'{args.path}: {counts["tags"]} tags over {guilds} guilds, {counts["warnings"]} warnings, '
+        f'{counts["guild_settings"]} guild_settings rows')
+    tags, modded = sample_targets(conn, rng, args.iterations)
+
+    layouts = {name: LAYOUTS[name] for name in args.layout}
+    if args.ddl:
+        layouts['custom'] = args.ddl
+    result = {
+        'database': args.path,
+        'sqlite': sqlite3.sqlite_version,
+        'python': sys.version.split()[0],
+        'rows': counts | {'guilds': guilds},
+        'iterations': args.iterations,
+        'layouts': {name: bench_layout(conn, name, ddl, tags, modded, args) for name, ddl in layouts.items()},
+    }
+    conn.close()
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='database to run against, see benchmarks.gen_data')
+    parser.add_argument('--layout', nargs='*', default=['current'], choices=LAYOUTS)
+    parser.add_argument('--ddl', nargs='*', help='statements for an extra "custom" layout')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--only', nargs='*', help='just these patterns')
+    parser.add_argument('--cache-entries', type=int, default=CACHE_ENTRIES)
+    parser.add_argument('--plans', action='store_true', help='print each query plan too')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='also write the results to this JSON file')
+    main(parser.parse_args())
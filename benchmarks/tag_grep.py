@@ -0,0 +1,98 @@
+"""Compares `tag grep` (FTS5) with a naive LIKE scan over a large synthetic tag set.
+
+Ranking with BM25 scores every match, so for the most common words it loses
+to the LIKE scan. tag grep counts matches up to GREP_RANK_LIMIT first and
+past that takes the first 10 unranked, `grep` below is what it actually
+costs and `ranked` is BM25 alone.
+
+Run from the repo root:
+    python -m benchmarks.tag_grep --tags 200000
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import time
+
+from utils.db import Database
+from utils.migrations import migrate, rebuild_tag_search
+
+COMMON = ('python discord bot install windows linux error token intents gateway '
+    'permission role channel message embed reaction command prefix cog extension '
+    'async await loop database sqlite cache index query rate limit member guild').split()
+
+# Same queries as Tags.tag_grep
+GREP_RANK_LIMIT = 500
+COUNT_QUERY = "SELECT COUNT(*) FROM (SELECT rowid FROM tags_fts WHERE tags_fts MATCH ? LIMIT ?)"
+FTS_QUERY = '''SELECT name, snippet(tags_fts, 1, '**', '**', '...', 12)
+    FROM tags_fts WHERE tags_fts MATCH ?
+    ORDER BY bm25(tags_fts, 2.0, 1.0, 0.0) LIMIT 10'''
+FIRST_QUERY = '''SELECT name, snippet(tags_fts, 1, '**', '**', '...', 12)
+    FROM tags_fts WHERE tags_fts MATCH ? LIMIT 10'''
+
+# Ranking needs every match, so the scan can't stop early either
+LIKE_QUERY = "SELECT name, content FROM tags WHERE guild_id=? AND content LIKE ?"
+
+def vocabulary(rng, size=20000):
+    words = list(COMMON)
+    while len(words) < size:
+        words.append(''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 10))))
+    # Zipf-ish, a few words are everywhere and most are rare
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return words, weights
+
+def synthetic_tags(count, guilds, rng):
+    words, weights = vocabulary(rng)
+    cum_weights = list(itertools.accumulate(weights))
+    for i in range(count):
+        content = ' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(10, 60)))
+        yield (rng.randrange(guilds), 0, 0, f'tag{i}', content, '')
+
+async def timed(db, sql, params, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        await db.fetchall(sql, params)
+    return (time.perf_counter() - start) / runs * 1000
+
+async def grep(db, match, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        row = await db.fetchone(COUNT_QUERY, (match, GREP_RANK_LIMIT))
+        await db.fetchall(FTS_QUERY if row[0] < GREP_RANK_LIMIT else FIRST_QUERY, (match,))
+    return (time.perf_counter() - start) / runs * 1000
+
+async def main(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = await Database(os.path.join(tmp, 'bench.sqlite')).start()
+        await migrate(db)
+        start = time.perf_counter()
+        await db.executemany("INSERT INTO tags(guild_id, author_id, uses, name, content, creation) VALUES(?,?,?,?,?,?)",
+            synthetic_tags(args.tags, args.guilds, rng))
+        print(f'Inserted {args.tags} tags in {time.perf_counter() - start:.2f}s')
+        start = time.perf_counter()
+        await db.transaction(rebuild_tag_search)
+        print(f'Bulk indexed in {time.perf_counter() - start:.2f}s')
+
+        # A term that rarely matches is the LIKE scan's worst case, a very common one BM25's
+        for term in ('python', 'gateway intents', 'sqlite', 'zzzmissing'):
+            guild = rng.randrange(args.guilds)
+            query = ' '.join(f'"{t}"' for t in term.split())
+            match = f'guild_id:{guild} AND {{name content}}: ({query})'
+            matches = (await db.fetchone(COUNT_QUERY, (match, -1)))[0]
+            ranked = await timed(db, FTS_QUERY, (match,), args.runs)
+            fts = await grep(db, match, args.runs)
+            like = await timed(db, LIKE_QUERY, (guild, f'%{term}%'), args.runs)
+            print(f'{term!r:>20}: {matches:6} matches  grep {fts:8.3f}ms ({like / fts:5.1f}x)  '
+                f'ranked {ranked:8.3f}ms ({like / ranked:5.1f}x)  like {like:8.3f}ms')
+        await db.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tags', type=int, default=200000)
+    parser.add_argument('--guilds', type=int, default=20)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
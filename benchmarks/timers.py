@@ -0,0 +1,71 @@
+"""Loads the timer dispatcher with a large backlog of pending timers.
+
+Books `--timers` timers spread over the next 30 days, plus a burst due in
+the next few seconds, then starts the dispatcher the way a restart would and
+reports how long that took, how much of the backlog ended up in memory and
+how late the burst fired.
+
+Run from the repo root:
+    python -m benchmarks.timers --timers 300000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from utils.db import Database
+from utils.migrations import migrate
+from utils.timers import TimerDispatcher
+
+async def main(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = await Database(os.path.join(tmp, 'timers.sqlite')).start()
+        await migrate(db)
+        now = int(time.time())
+        rows = [('tempmute', now + rng.randint(3600, 30 * 86400), rng.randint(1, 500), rng.randint(1, 10**6), None, now)
+            for _ in range(args.timers)]
+        burst = now + 2
+        rows += [('tempmute', burst + i % 3, 1, i, None, now) for i in range(args.burst)]
+        start = time.perf_counter()
+        await db.executemany('''INSERT INTO timers(event, expires, guild_id, user_id, data, created_at)
+            VALUES(?,?,?,?,?,?)''', rows)
+        print(f'Booked {len(rows)} timers in {time.perf_counter() - start:.1f}s')
+
+        lateness = []
+        done = asyncio.Event()
+
+        def dispatch(event, timer):
+            lateness.append(time.time() - timer.expires)
+            if len(lateness) == args.burst:
+                done.set()
+
+        tracemalloc.start()
+        timers = TimerDispatcher(db, dispatch, window=args.window)
+        start = time.perf_counter()
+        await timers.start()
+        loaded = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        print(f'Started in {loaded * 1000:.0f}ms holding {len(timers)} of {len(rows)} timers '
+            f'(window {args.window}s), peak {peak / 1024:.0f} KiB traced')
+
+        await asyncio.wait_for(done.wait(), 30)
+        lateness.sort()
+        print(f'Fired {len(lateness)}: lateness p50 {lateness[len(lateness) // 2] * 1000:.0f}ms, '
+            f'max {lateness[-1] * 1000:.0f}ms (timestamps are whole seconds)')
+        left = await db.fetchone("SELECT COUNT(*) FROM timers")
+        print(f'{left[0]} timers still pending in the table, {len(timers)} in memory')
+        tracemalloc.stop()
+        await timers.close()
+        await db.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--timers', type=int, default=300000)
+    parser.add_argument('--burst', type=int, default=1000, help='timers due in the next few seconds')
+    parser.add_argument('--window', type=int, default=3600)
+    parser.add_argument('--seed', type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -7,12 +7,20 @@ import traceback
 import sys
 
 # Storing in SQLITE3 as Bot not in massive number of servers
-import sqlite3
 import asyncio
 import contextlib
 from aiohttp import ClientSession
 
 # Mine
+from utils.db import Database
+from utils.migrations import migrate
+from utils.prefixes import PrefixCache
+from utils.tagcounts import TagUseBuffer
+from utils.members import MemberIndex
+from utils.roles import RoleIndex
+from utils.timers import TimerDispatcher
+from utils.metrics import Metrics
+from utils.watchdog import LoopWatchdog
 # from utils.help import MyHelp
 # from secrets import config
 
@@ -23,23 +31,22 @@ from aiohttp import ClientSession
 MODULES = [
     'modules.fun',
     'modules.moderation',
+    'modules.owner',
     'modules.tags'
 ]
 
 DEFAULT_PREFIX = '.'
 
-db_conn = sqlite3.connect('main.sqlite')
-db_c = db_conn.cursor()
+# Prometheus scrapes /metrics here, local only
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
 
 def get_prefix(bot,msg):
-    db_c.execute("SELECT prefix FROM guild_settings WHERE guild_id=?", (msg.guild.id,))
-    prefix_result = db_c.fetchone()
-    if prefix_result is None:
-        db_c.execute("INSERT INTO guild_settings(guild_id, prefix) VALUES(?,?)", (msg.guild.id, DEFAULT_PREFIX))
-        db_conn.commit()
+    # Served from memory, see utils.prefixes
+    if msg.guild is None:
         prefix = DEFAULT_PREFIX
     else:
-        prefix = prefix_result[0]
+        prefix = bot.prefixes.get(msg.guild.id)
     return commands.when_mentioned_or(prefix)(bot, msg)
 
 async def load_modules(bot):
@@ -52,9 +59,11 @@ async def load_modules(bot):
             traceback.print_exc()
 
 async def run():
-    db_c.execute("CREATE TABLE IF NOT EXISTS guild_settings(guild_id, prefix)")
-    async with ClientSession() as session:
-        bot = Mollie(session=session, db_c=db_c, db_conn=db_conn)
+    db = await Database('main.sqlite').start()
+    await migrate(db)
+    metrics = Metrics()
+    async with ClientSession(trace_configs=[metrics.http_trace('session')]) as session:
+        bot = Mollie(session=session, db=db, metrics=metrics, metrics_port=METRICS_PORT)
         try:
             await load_modules(bot)
             # await bot.start(TOKEN)
@@ -64,6 +73,7 @@ async def run():
 
 class Mollie(commands.Bot):
     def __init__(self, **kwargs):
+        metrics = kwargs.pop('metrics', None) or Metrics()
         super().__init__(
             command_prefix=get_prefix,
             description='Mollie Bot, pretty cool',
@@ -80,13 +90,32 @@ class Mollie(commands.Bot):
             activity=discord.Activity(
                 type=discord.ActivityType.watching,
                 name='purring'
-            )
+            ),
+            http_trace=metrics.http_trace('discord')
         )
         # self.owner_id=OWNER_ID
         # self.bot_id=BOT_ID
         self.session=kwargs.pop('session')
-        self.db_c=kwargs.pop('db_c')
-        self.db_conn=kwargs.pop('db_conn')
+        self.db=kwargs.pop('db')
+        self.prefixes=PrefixCache(self.db, DEFAULT_PREFIX)
+        self.tag_uses=TagUseBuffer(self.db)
+        self.member_names=MemberIndex()
+        self.role_names=RoleIndex()
+        self.timers=TimerDispatcher(self.db, self.dispatch)
+        self.metrics=metrics
+        self.metrics_port=kwargs.pop('metrics_port', None)
+        self.db.on_query=metrics.observe_db
+        self.before_invoke(metrics.before_invoke)
+        self.after_invoke(metrics.after_invoke)
+        self.watchdog=LoopWatchdog()
+        metrics.collectors.append(self.watchdog.render)
+
+    async def setup_hook(self):
+        await self.prefixes.load()
+        self.tag_uses.start()
+        self.watchdog.start()
+        if self.metrics_port is not None:
+            await self.metrics.serve(METRICS_HOST, self.metrics_port)
 
     @property
     def colour(self):
@@ -97,8 +126,40 @@ class Mollie(commands.Bot):
         self.uptime = discord.utils.utcnow()
         print(f'Logged in as: {self.user}')
         print(f'Can see {len(self.guilds)} Guilds and {len(self.users)} Users')
+        # Started here rather than in setup_hook so overdue timers find their guilds cached
+        await self.timers.start()
+
+    # Keeps the SearchMember name index in step with the member cache
+    async def on_member_join(self, member):
+        self.member_names.add(member)
+
+    async def on_member_update(self, before, after):
+        self.member_names.add(after)
+
+    async def on_user_update(self, before, after):
+        self.member_names.update_user(self, after)
+
+    async def on_member_remove(self, member):
+        self.member_names.remove(member.guild.id, member.id)
+
+    async def on_guild_remove(self, guild):
+        self.member_names.drop(guild.id)
+        self.role_names.invalidate(guild.id)
+
+    # And the SearchRole one, rebuilt on the next lookup
+    async def on_guild_role_create(self, role):
+        self.role_names.invalidate(role.guild.id)
+
+    async def on_guild_role_update(self, before, after):
+        if before.name != after.name or before.position != after.position:
+            self.role_names.invalidate(after.guild.id)
+
+    async def on_guild_role_delete(self, role):
+        self.role_names.invalidate(role.guild.id)
 
     async def on_command_error(self, ctx, error):
+        self.metrics.error(ctx, getattr(error, 'original', error))
+
         # I believe the beginning part of this is from Rapptz's Documentation
         # Could be wrong..
         if hasattr(ctx.command, 'on_error'):
@@ -124,13 +185,14 @@ class Mollie(commands.Bot):
             if not ctx.guild:
                 raise commands.NoPrivateMessage
             else:
-                self.db_c.execute("SELECT content FROM tags WHERE name=$1 AND guild_id=$2", (lookup, ctx.guild.id))
-                t = self.db_c.fetchone()
-                if t is None:
+                tags = self.get_cog('tags')
+                if tags is None:
+                    return
+                content = await tags.get_tag_content(ctx.guild.id, lookup)
+                if content is None:
                     return
-                await ctx.send(t[0])
-                self.db_c.execute("UPDATE tags SET uses = uses + 1 WHERE name=$1 AND guild_id=$2", (lookup, ctx.guild.id))
-                self.db_conn.commit()
+                await ctx.send(content)
+                self.tag_uses.add(ctx.guild.id, lookup)
 
         elif isinstance(error, commands.MissingPermissions):
             error = error.missing_perms[0].replace('_', ' ')
@@ -166,6 +228,12 @@ class Mollie(commands.Bot):
     async def close(self):
         await super().close()
         await self.session.close()
-
-loop = asyncio.get_event_loop()
-loop.run_until_complete(run())
\ No newline at end of file
+        await self.tag_uses.close()
+        await self.timers.close()
+        await self.metrics.close()
+        await self.watchdog.close()
+        await self.db.close()
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(run())
\ No newline at end of file
@@ -1,23 +1,48 @@
 import discord
-from datetime import datetime
+import re
+import math
 from discord.ext import commands
 from discord.ext.commands.errors import RoleNotFound
-from typing import Optional
+from typing import Optional, Union
 from contextlib import suppress
-from utils.converters import SearchMember, SearchRole
+from utils.converters import SearchMember, SearchRole, Duration, When
+from utils.bulkroles import BulkRoleManager
+from utils.massmod import MassAction
+from utils.purge import Purge, RegexCheck, RegexWorker
+from utils.bans import BanIndex
+from utils.muterole import MuteRoles
+from utils.modlog import log_action, history_pager, count_history, mod_stats, top_moderators, rebuild_mod_stats
+from utils.menus import MyMenu, KeysetPageSource
+
+# How many messages a filtered purge looks through before giving up
+PURGE_SCAN_LIMIT = 2000
+MODLOG_PAGE_SIZE = 10
+
+class ModLogFlags(commands.FlagConverter):
+    type: Optional[str] = None
+    mod: Optional[discord.User] = None
+    user: Optional[discord.User] = None
+    after: Optional[When] = None
+    before: Optional[When] = None
 
 class BannedMember(commands.Converter):
     # Thanks Rapptz x
+    # Served from the mod cog's ban index, only an id lookup before it's loaded hits the API
     async def convert(self, ctx, argument):
+        bans = ctx.cog.ban_index
         if argument.isdigit():
             member_id = int(argument, base=10)
-            try:
-                return await ctx.guild.fetch_ban(discord.Object(id=member_id))
-            except discord.NotFound:
-                raise commands.BadArgument('This member has not been banned before.') from None
-
-        ban_list = await ctx.guild.bans()
-        entity = discord.utils.find(lambda u: str(u.user) == argument, ban_list)
+            index = bans.loaded(ctx.guild.id)
+            if index is not None:
+                entity = index.entries.get(member_id)
+            else:
+                try:
+                    return await ctx.guild.fetch_ban(discord.Object(id=member_id))
+                except discord.NotFound:
+                    entity = None
+        else:
+            index = await bans.get(ctx.guild)
+            entity = index.named(argument)
 
         if entity is None:
             raise commands.BadArgument('This member has not been banned before.')
@@ -26,31 +51,79 @@ class BannedMember(commands.Converter):
 class Moderation(commands.Cog, name='mod', description='Moderation Based Commands'):
     def __init__(self, bot):
         self.bot = bot
-        self.db_c = bot.db_c
-        self.db_conn = bot.db_conn
-        self.db_c.execute('''CREATE TABLE IF NOT EXISTS 
-            warnings(guild_id, user_id, mod_id, mod_type, reason, date)''')
+        self.db = bot.db
+        self.role_jobs = BulkRoleManager(bot)
+        self.ban_index = BanIndex()
+        self.mute_roles = MuteRoles(bot)
+        self.regex_worker = RegexWorker()
+
+    async def cog_unload(self):
+        await self.role_jobs.stop()
+        await self.regex_worker.close()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        await self.role_jobs.resume()
+
+    @commands.Cog.listener()
+    async def on_member_ban(self, guild, user):
+        self.ban_index.ban(guild, user)
+
+    @commands.Cog.listener()
+    async def on_member_unban(self, guild, user):
+        self.ban_index.unban(guild, user)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.ban_index.drop(guild.id)
+        self.mute_roles.invalidate(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.mute_roles.invalidate(role.guild.id, role.id)
+
+    @commands.Cog.listener()
+    async def on_tempmute_timer_complete(self, timer):
+        guild = self.bot.get_guild(timer.guild_id)
+        member = guild and guild.get_member(timer.user_id)
+        role = guild and guild.get_role(timer.extra.get('role_id', 0))
+        if member is None or role is None or role not in member.roles:
+            return
+        with suppress(discord.HTTPException):
+            await member.remove_roles(role, reason='Temporary mute expired')
+            await log_action(self.db, guild.id, member.id, self.bot.user.id, 'Unmute', 'Temporary mute expired')
+
+    @commands.Cog.listener()
+    async def on_tempban_timer_complete(self, timer):
+        guild = self.bot.get_guild(timer.guild_id)
+        if guild is None:
+            return
+        with suppress(discord.HTTPException):
+            await guild.unban(discord.Object(id=timer.user_id), reason='Temporary ban expired')
+            await log_action(self.db, guild.id, timer.user_id, self.bot.user.id, 'Unban', 'Temporary ban expired')
 
     @commands.group(invoke_without_command=True, name='prefix', help='The bot\'s prefix in the server')
     @commands.bot_has_guild_permissions(send_messages=True)
     async def prefix(self, ctx):
-        self.db_c.execute("SELECT prefix FROM guild_settings WHERE guild_id=$1",(ctx.guild.id,))
-        pre = self.db_c.fetchone()
-        if not pre:
-            return await ctx.send('My prefix here is `.`')
-        return await ctx.send(f'My prefix here is `{pre[0]}`')
+        pre = self.bot.prefixes.get(ctx.guild.id)
+        return await ctx.send(f'My prefix here is `{pre}`')
 
     @prefix.command(name='set', aliases=['add', 'change'], help='Change the bot\'s prefix in the server')
     @commands.has_guild_permissions(manage_guild=True)
     @commands.bot_has_guild_permissions(send_messages=True)
     async def prefix_set(self, ctx, pre=None):
         if pre is not None:
-            self.db_c.execute("UPDATE guild_settings SET prefix=$1 WHERE guild_id=$2",(pre,ctx.guild.id))
-            self.db_conn.commit()
+            await self.bot.prefixes.set(ctx.guild.id, pre)
             return await ctx.send(f'Prefix set to `{pre}`')
         else:
             return await ctx.send('Please specify the new prefix')
 
+    @prefix.command(name='stats', hidden=True, help='Prefix cache hit/miss counters')
+    @commands.is_owner()
+    async def prefix_stats(self, ctx):
+        stats = self.bot.prefixes.stats
+        return await ctx.send(f'Cached **{stats["guilds"]}** guilds, **{stats["hits"]}** hits, **{stats["misses"]}** defaulted (no DB reads)')
+
     @commands.command(name='warn', help='Warn a member')
     @commands.has_guild_permissions(manage_messages=True)
     @commands.bot_has_guild_permissions(send_messages=True)
@@ -65,11 +138,8 @@ class Moderation(commands.Cog, name='mod', description='Moderation Based Command
         else:
             with suppress(discord.HTTPException):
                 await member.send(f'Warned in {ctx.guild.name} for {reason} by {ctx.author}')
-            warned_at = datetime.utcnow().strftime('%D')
             mod_type = 'Warn'
-            self.db_c.execute("INSERT INTO warnings VALUES($1,$2,$3,$4,$5,$6)",
-                (ctx.guild.id, member.id, ctx.author.id, mod_type, reason, warned_at))
-            self.db_conn.commit()
+            await log_action(self.db, ctx.guild.id, member.id, ctx.author.id, mod_type, reason)
             return await ctx.send(f'Warned {member.mention}')
 
     @commands.command(name='kick', help='Kick a member from the server')
@@ -87,11 +157,8 @@ class Moderation(commands.Cog, name='mod', description='Moderation Based Command
             with suppress(discord.HTTPException):
                 await member.send(f'Kicked from {ctx.guild.name} for {reason} by {ctx.author}')
             await member.kick(reason=f'{reason} | {ctx.author}')
-            warned_at = datetime.utcnow().strftime('%D')
             mod_type = 'Kick'
-            self.db_c.execute("INSERT INTO warnings VALUES($1,$2,$3,$4,$5,$6)",
-                (ctx.guild.id, member.id, ctx.author.id, mod_type, reason, warned_at))
-            self.db_conn.commit()             
+            await log_action(self.db, ctx.guild.id, member.id, ctx.author.id, mod_type, reason)
             return await ctx.send(f'Kicked {member.mention}')
 
     @commands.command(name='kicks', help='Kicks a list of members from the server')
@@ -100,27 +167,9 @@ class Moderation(commands.Cog, name='mod', description='Moderation Based Command
     async def kicks(self, ctx, members: commands.Greedy[discord.Member], *, reason:Optional[str]="No reason provided"):
         if len(members) == 0:
             return await ctx.send_help(ctx.command)
-        kickedMembers = []
-        warned_at = datetime.utcnow().strftime('%D')
-        mod_type = 'Kick'
-        for member in members:
-            if member == ctx.guild.owner:
-                await ctx.send('Cannot kick the owner')
-            if not ctx.author == ctx.guild.owner:
-                if member.top_role >= ctx.author.top_role:
-                    await ctx.send(f'Cannot kick **{member}**, check your role position')
-            if member.top_role >= ctx.guild.me.top_role:
-                await ctx.send(f'Cannot kick **{member}**, check my top role position')
-            else:
-                with suppress(discord.HTTPException):
-                    await member.send(f'Kicked from {ctx.guild.name} for {reason} by {ctx.author}')
-                await member.kick(reason=f'{reason} | {ctx.author}')
-                kickedMembers.append(member.mention)
-                self.db_c.execute("INSERT INTO warnings VALUES($1,$2,$3,$4,$5,$6)",
-                (ctx.guild.id, member.id, ctx.author.id, mod_type, reason, warned_at))
-                self.db_conn.commit()
-        kickedMembers = ", ".join(kickedMembers)
-        return await ctx.send(f'Kicked {kickedMembers}')
+        async with ctx.typing():
+            result = await MassAction(ctx, members, 'Kick', reason).run()
+        return await ctx.send(result.summary())
 
     @commands.command(name='ban', help='Ban a member from the server')
     @commands.has_guild_permissions(ban_members=True)
@@ -134,43 +183,59 @@ class Moderation(commands.Cog, name='mod', description='Moderation Based Command
         if member.top_role >= ctx.guild.me.top_role:
             return await ctx.send(f'Cannot ban **{member}**, check my top role position')
         else:
-            warned_at = datetime.utcnow().strftime('%D')
             mod_type = 'Ban'
             with suppress(discord.HTTPException):
                 await member.send(f'Banned from {ctx.guild.name} for {reason} by {ctx.author}')
             await member.ban(reason=f'{reason} | {ctx.author}')
-            self.db_c.execute("INSERT INTO warnings VALUES($1,$2,$3,$4,$5,$6)",
-                (ctx.guild.id, member.id, ctx.author.id, mod_type, reason, warned_at))
-            self.db_conn.commit()
+            await log_action(self.db, ctx.guild.id, member.id, ctx.author.id, mod_type, reason)
             return await ctx.send(f'Banned {member.mention}')
     
-    @commands.command(name='bans', help='Bans a list of members from the server')
+    @commands.command(name='tempban', help='Ban a member for a while, e.g. 1d or 1w')
+    @commands.has_guild_permissions(ban_members=True)
+    @commands.bot_has_guild_permissions(send_messages=True, ban_members=True)
+    async def tempban(self, ctx, member: SearchMember, duration: Duration, *, reason:Optional[str]="No reason provided"):
+        if member == ctx.guild.owner:
+            return await ctx.send('Cannot ban the owner')
+        if not ctx.author == ctx.guild.owner:
+            if member.top_role >= ctx.author.top_role:
+                return await ctx.send(f'Cannot ban **{member}**, check your role position')
+        if member.top_role >= ctx.guild.me.top_role:
+            return await ctx.send(f'Cannot ban **{member}**, check my top role position')
+        else:
+            expires = discord.utils.utcnow() + duration
+            mod_type = 'Tempban'
+            with suppress(discord.HTTPException):
+                await member.send(f'Banned from {ctx.guild.name} until {discord.utils.format_dt(expires)} for {reason} by {ctx.author}')
+            await member.ban(reason=f'{reason} | {ctx.author}')
+            await self.bot.timers.cancel('tempban', ctx.guild.id, member.id)
+            await self.bot.timers.create('tempban', expires, ctx.guild.id, member.id)
+            await log_action(self.db, ctx.guild.id, member.id, ctx.author.id, mod_type, reason)
+            return await ctx.send(f'Banned {member.mention}, unbanning {discord.utils.format_dt(expires, "R")}')
+
+    @commands.group(name='bans', invoke_without_command=True, help='Bans a list of members from the server')
     @commands.has_guild_permissions(ban_members=True)
     @commands.bot_has_guild_permissions(send_messages=True, ban_members=True)
     async def bans(self, ctx, members: commands.Greedy[discord.Member], *, reason:Optional[str]="No reason provided"):
         if len(members) == 0:
             return await ctx.send_help(ctx.command)
-        bannedMembers = []
-        warned_at = datetime.utcnow().strftime('%D')
-        mod_type = 'Ban'
-        for member in members:
-            if member == ctx.guild.owner:
-                await ctx.send('Cannot ban the owner')
-            if not ctx.author == ctx.guild.owner:
-                if member.top_role >= ctx.author.top_role:
-                    await ctx.send(f'Cannot ban **{member}**, check your role position')
-            if member.top_role >= ctx.guild.me.top_role:
-                await ctx.send(f'Cannot ban **{member}**, check my top role position')
-            else:
-                with suppress(discord.HTTPException):
-                    await member.send(f'Banned from {ctx.guild.name} for {reason} by {ctx.author}')
-                await member.ban(reason=f'{reason} | {ctx.author}')
-                bannedMembers.append(member.mention)
-                self.db_c.execute("INSERT INTO warnings VALUES($1,$2,$3,$4,$5,$6)",
-                (ctx.guild.id, member.id, ctx.author.id, mod_type, reason, warned_at))
-                self.db_conn.commit()
-        bannedMembers = ", ".join(bannedMembers)
-        return await ctx.send(f'Banned {bannedMembers}')
+        async with ctx.typing():
+            result = await MassAction(ctx, members, 'Ban', reason).run()
+        return await ctx.send(result.summary())
+
+    @bans.command(name='search', aliases=['find'], help='Search the server\'s bans by name')
+    @commands.has_guild_permissions(ban_members=True)
+    @commands.bot_has_guild_permissions(send_messages=True, ban_members=True)
+    async def bans_search(self, ctx, *, text):
+        async with ctx.typing():
+            index = await self.ban_index.get(ctx.guild)
+        results = index.search(text, limit=20)
+        if not results:
+            return await ctx.send(f'No bans matching **{text}** out of **{len(index)}**')
+        em = discord.Embed(colour=self.bot.colour, title=f'Bans matching {text}'[:256])
+        em.description = '\n'.join(
+            f'**{entry.user}** ({entry.user.id}){f": {entry.reason}" if entry.reason else ""}'[:200] for entry in results)
+        em.set_footer(text=f'{len(results)} shown, {len(index)} bans in total')
+        return await ctx.send(embed=em)
 
     @commands.command(name='softban', aliases=['sban'], help='Soft bans a member from the server')
     @commands.has_guild_permissions(ban_members=True)
@@ -184,15 +249,12 @@ class Moderation(commands.Cog, name='mod', description='Moderation Based Command
         if member.top_role >= ctx.guild.me.top_role:
             return await ctx.send(f'Cannot softban **{member}**, check my role position')
         else:
-            warned_at = datetime.utcnow().strftime('%D')
             mod_type = 'Softban'
             with suppress(discord.HTTPException):
                 await member.send(f'Softbanned from {ctx.guild.name} for {reason} by {ctx.author}')
             await member.ban(reason=f'{reason} | {ctx.author}')
             await ctx.guild.unban(member, reason=f'{reason} | {ctx.author}')
-            self.db_c.execute("INSERT INTO warnings VALUES($1,$2,$3,$4,$5,$6)",
-                (ctx.guild.id, member.id, ctx.author.id, mod_type, reason, warned_at))
-            self.db_conn.commit()
+            await log_action(self.db, ctx.guild.id, member.id, ctx.author.id, mod_type, reason)
             return await ctx.send(f'Softbanned {member.mention}')
 
     @commands.command(name='unban', aliases=['uban'], help='Unbans a member from the server')
@@ -201,27 +263,66 @@ class Moderation(commands.Cog, name='mod', description='Moderation Based Command
     async def unban(self, ctx, member: BannedMember, *, reason: Optional[str] = "No reason provided"):
         # Thanks Rapptz x
         await ctx.guild.unban(member.user, reason=reason)
+        await self.bot.timers.cancel('tempban', ctx.guild.id, member.user.id)
         if member.reason:
             return await ctx.send(f'Unbanned {member.user} (ID: {member.user.id}), previously banned for {member.reason}.')
         else:
             return await ctx.send(f'Unbanned {member.user} (ID: {member.user.id}).')
 
-    @commands.group(name='purge', invoke_without_command=True, help='Purge Messages', aliases=['prune'])
-    @commands.has_guild_permissions(manage_messages=True)
-    @commands.bot_has_guild_permissions(send_messages=True, manage_messages=True)
-    async def purge(self, ctx, limit: int, *, member: SearchMember=None):
+    async def do_purge(self, ctx, limit, check=None, *, page_check=None, before=None, after=None):
         if limit > 500:
             return await ctx.send(f'Limit is 500 messages')
         await ctx.message.delete()
-        msg = []
-        if not member:
-            return await ctx.channel.purge(limit=limit)
-        async for m in ctx.channel.history():
-            if len(msg) == limit:
-                break
-            if m.author == member:
-                msg.append(m)
-        return await ctx.channel.delete_messages(msg)
+        # Without a filter every message scanned is a match, with one don't page through the whole channel
+        scan_limit = limit if check is None and page_check is None else max(limit, PURGE_SCAN_LIMIT)
+        result = await Purge(ctx.channel, limit, check, page_check=page_check, scan_limit=scan_limit,
+            before=before or ctx.message, after=after).run()
+        return await ctx.send(result.summary(), delete_after=10)
+
+    @commands.group(name='purge', invoke_without_command=True, help='Purge messages from the last 14 days, older ones can\'t be bulk deleted', aliases=['prune'])
+    @commands.has_guild_permissions(manage_messages=True)
+    @commands.bot_has_guild_permissions(send_messages=True, manage_messages=True)
+    async def purge(self, ctx, limit: int, *, member: SearchMember=None):
+        check = None if member is None else (lambda m: m.author == member)
+        return await self.do_purge(ctx, limit, check)
+
+    @purge.command(name='bots', help='Purge messages sent by bots')
+    @commands.has_guild_permissions(manage_messages=True)
+    @commands.bot_has_guild_permissions(send_messages=True, manage_messages=True)
+    async def purge_bots(self, ctx, limit: int):
+        return await self.do_purge(ctx, limit, lambda m: m.author.bot)
+
+    @purge.command(name='files', aliases=['attachments', 'images'], help='Purge messages with attachments')
+    @commands.has_guild_permissions(manage_messages=True)
+    @commands.bot_has_guild_permissions(send_messages=True, manage_messages=True)
+    async def purge_files(self, ctx, limit: int):
+        return await self.do_purge(ctx, limit, lambda m: m.attachments)
+
+    @purge.command(name='regex', aliases=['match'], help='Purge messages matching a regex')
+    @commands.has_guild_permissions(manage_messages=True)
+    @commands.bot_has_guild_permissions(send_messages=True, manage_messages=True)
+    async def purge_regex(self, ctx, limit: int, *, pattern):
+        try:
+            check = RegexCheck(self.regex_worker, pattern)
+        except ValueError as e:
+            return await ctx.send(str(e))
+        except re.error as e:
+            return await ctx.send(f'Invalid regex: {e}')
+        return await self.do_purge(ctx, limit, page_check=check)
+
+    @purge.command(name='before', help='Purge messages sent before a message')
+    @commands.has_guild_permissions(manage_messages=True)
+    @commands.bot_has_guild_permissions(send_messages=True, manage_messages=True)
+    async def purge_before(self, ctx, message: discord.PartialMessage, limit: int, *, member: SearchMember=None):
+        check = None if member is None else (lambda m: m.author == member)
+        return await self.do_purge(ctx, limit, check, before=message)
+
+    @purge.command(name='after', help='Purge messages sent after a message')
+    @commands.has_guild_permissions(manage_messages=True)
+    @commands.bot_has_guild_permissions(send_messages=True, manage_messages=True)
+    async def purge_after(self, ctx, message: discord.PartialMessage, limit: int, *, member: SearchMember=None):
+        check = None if member is None else (lambda m: m.author == member)
+        return await self.do_purge(ctx, limit, check, after=message)
 
     @commands.command(name='lock', help='Lock a Channel')
     @commands.has_guild_permissions(manage_channels=True)
@@ -292,13 +393,9 @@ class Moderation(commands.Cog, name='mod', description='Moderation Based Command
                 return await ctx.send(f'Cannot manage **{role}**, check your role position')
         if role >= ctx.guild.me.top_role:
             return await ctx.send(f'Cannot manage **{role}**, check my role position')
-        total_members = [member for member in ctx.guild.members if role not in member.roles and not member.bot]
-        msg = await ctx.send(f'⏲️ Adding **{role}** to **{len(total_members)}** Members')
-        async with ctx.typing():
-            for user in total_members:
-                with suppress(discord.Forbidden):
-                    await user.add_roles(role)
-        return await msg.reply(f'✅ Added **{role}** to **{len(total_members)}** Members')
+        job = await self.role_jobs.start(ctx, role, add=True)
+        if job is None:
+            return await ctx.send(f'A role job is already running here, `{ctx.prefix}role cancel` to stop it')
 
     @role.command(name='removeall', aliases=['rall'], help='Remove a Role from Everyone')
     @commands.guild_only()
@@ -314,13 +411,19 @@ class Moderation(commands.Cog, name='mod', description='Moderation Based Command
                 return await ctx.send(f'Cannot manage **{role}**, check your role position')
         if role >= ctx.guild.me.top_role:
             return await ctx.send(f'Cannot manage **{role}**, check my role position')
-        total_members = [member for member in ctx.guild.members if role in member.roles and not member.bot]
-        msg = await ctx.send(f'⏲️ Removing **{role}** from **{len(total_members)}** Members')
-        async with ctx.typing():
-            for user in total_members:
-                with suppress(discord.Forbidden):
-                    await user.remove_roles(role)
-        return await msg.reply(f'✅ Removed **{role}** from **{len(total_members)}** Members')
+        job = await self.role_jobs.start(ctx, role, add=False)
+        if job is None:
+            return await ctx.send(f'A role job is already running here, `{ctx.prefix}role cancel` to stop it')
+
+    @role.command(name='cancel', aliases=['stop'], help='Cancel a running addall/removeall')
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_roles=True)
+    @commands.bot_has_guild_permissions(send_messages=True)
+    async def role_cancel(self, ctx):
+        job = await self.role_jobs.cancel(ctx.guild.id)
+        if job is None:
+            return await ctx.send('There is no role job running here')
+        return await ctx.send(f'Cancelled after **{job.handled}** of **{len(job.member_ids)}** Members')
 
     @role.command(name='create', help='Create a Role')
     @commands.guild_only()
@@ -407,6 +510,12 @@ class Moderation(commands.Cog, name='mod', description='Moderation Based Command
             await role.edit(name=newrolename)
             return await ctx.send(f'Role **{rolename}\'s** Name changed to **{newrolename}**')
 
+    def unapplied_note(self, guild):
+        failed = self.mute_roles.pop_unapplied(guild.id)
+        if not failed:
+            return ''
+        return f'\nCreated a Muted role but couldn\'t deny it in **{failed}** channels, check my permissions there'
+
     @commands.command(name='muterole', help='Set a Muted role', aliases=['mutedrole'])
     @commands.has_guild_permissions(manage_guild=True)
     @commands.bot_has_guild_permissions(send_messages=True, manage_roles=True)
@@ -418,37 +527,14 @@ class Moderation(commands.Cog, name='mod', description='Moderation Based Command
                 return await ctx.send(f'Cannot manage **{role}**, check your role position')
         if role >= ctx.guild.me.top_role:
             return await ctx.send(f'Cannot manage **{role}**, check my role position')
-        self.db_c.execute("UPDATE guild_settings SET muterole=$1 WHERE guild_id=$2", (role.id, ctx.guild.id))
-        self.db_conn.commit()
+        await self.mute_roles.save(role)
         return await ctx.send(f'Muted role set as {role.mention}')
 
-    async def search_mute(self, ctx):
-        self.db_c.execute("SELECT muterole FROM guild_settings WHERE guild_id=$1",(ctx.guild.id,))
-        result = self.db_c.fetchone()
-        if result is None:
-            muteRole = discord.utils.find(lambda r: r.name.lower() == 'muted', ctx.guild.roles)
-            if muteRole is None:
-                muteRole = await ctx.guild.create_role(name='Muted', reason='Bot Muted Role')
-                self.db_c.execute("UPDATE guild_settings SET muterole=$1 WHERE guild_id=$2", 
-                (muteRole.id, ctx.guild.id))
-                self.db_conn.commit()
-        else:
-            muteRole = result[0]
-            muteRole = ctx.guild.get_role(muteRole)
-            if muteRole is None:
-                muteRole = discord.utils.find(lambda r: r.name.lower() == 'muted', ctx.guild.roles)
-                if muteRole is None:
-                    muteRole = await ctx.guild.create_role(name='Muted', reason='Bot Muted Role')
-                    self.db_c.execute("UPDATE guild_settings SET muterole=$1 WHERE guild_id=$2", 
-                    (muteRole.id, ctx.guild.id))
-                    self.db_conn.commit()
-        return muteRole
-
     @commands.command(name='mute', help='Mute a member')
     @commands.has_guild_permissions(manage_messages=True)
     @commands.bot_has_guild_permissions(send_messages=True, manage_roles=True)
     async def mute(self, ctx, member: SearchMember, *, reason: Optional[str] = "No reason provided"):
-        muteRole = await self.search_mute(ctx)
+        muteRole = await self.mute_roles.get(ctx.guild)
         if member == ctx.guild.owner:
             return await ctx.send(f'Cannot mute the owner')
         if muteRole in member.roles:
@@ -459,21 +545,43 @@ class Moderation(commands.Cog, name='mod', description='Moderation Based Command
         if member.top_role >= ctx.guild.me.top_role:
             return await ctx.send(f'Cannot mute **{member}**, check my role position')
         else:
-            warned_at = datetime.utcnow().strftime('%D')
             mod_type = 'Mute'
             await member.add_roles(muteRole)
-            self.db_c.execute("INSERT INTO warnings VALUES($1,$2,$3,$4,$5,$6)",
-                (ctx.guild.id, member.id, ctx.author.id, mod_type, reason, warned_at))
-            self.db_conn.commit()
-            await ctx.send(f'Muted {member.mention}')
+            await log_action(self.db, ctx.guild.id, member.id, ctx.author.id, mod_type, reason)
+            await ctx.send(f'Muted {member.mention}{self.unapplied_note(ctx.guild)}')
             with suppress(discord.HTTPException):
                 return await member.send(f'You were muted in {ctx.guild.name} for {reason}')
 
+    @commands.command(name='tempmute', help='Mute a member for a while, e.g. 10m or 2h')
+    @commands.has_guild_permissions(manage_messages=True)
+    @commands.bot_has_guild_permissions(send_messages=True, manage_roles=True)
+    async def tempmute(self, ctx, member: SearchMember, duration: Duration, *, reason: Optional[str] = "No reason provided"):
+        muteRole = await self.mute_roles.get(ctx.guild)
+        if member == ctx.guild.owner:
+            return await ctx.send(f'Cannot mute the owner')
+        if not ctx.author == ctx.guild.owner:
+            if member.top_role >= ctx.author.top_role:
+                return await ctx.send(f'Cannot mute **{member}**, check your role position')
+        if member.top_role >= ctx.guild.me.top_role:
+            return await ctx.send(f'Cannot mute **{member}**, check my role position')
+        else:
+            expires = discord.utils.utcnow() + duration
+            mod_type = 'Tempmute'
+            # Muting someone who's already muted just moves their unmute
+            if muteRole not in member.roles:
+                await member.add_roles(muteRole)
+            await self.bot.timers.cancel('tempmute', ctx.guild.id, member.id)
+            await self.bot.timers.create('tempmute', expires, ctx.guild.id, member.id, role_id=muteRole.id)
+            await log_action(self.db, ctx.guild.id, member.id, ctx.author.id, mod_type, reason)
+            await ctx.send(f'Muted {member.mention}, unmuting {discord.utils.format_dt(expires, "R")}{self.unapplied_note(ctx.guild)}')
+            with suppress(discord.HTTPException):
+                return await member.send(f'You were muted in {ctx.guild.name} until {discord.utils.format_dt(expires)} for {reason}')
+
     @commands.command(name='unmute', help='Unmute a member')
     @commands.has_guild_permissions(manage_messages=True)
     @commands.bot_has_guild_permissions(send_messages=True, manage_roles=True)
     async def unmute(self, ctx, member: SearchMember, *, reason: Optional[str] = "No reason provided"):
-        muteRole = await self.search_mute(ctx)
+        muteRole = await self.mute_roles.get(ctx.guild)
         if member == ctx.guild.owner:
             return await ctx.send(f'Cannot unmute the owner')
         if muteRole not in member.roles:
@@ -484,15 +592,92 @@ class Moderation(commands.Cog, name='mod', description='Moderation Based Command
         if member.top_role >= ctx.guild.me.top_role:
             return await ctx.send(f'Cannot unmute **{member}**, check my role position')
         else:
-            warned_at = datetime.utcnow().strftime('%D')
             mod_type = 'Unmute'
             await member.remove_roles(muteRole)
-            self.db_c.execute("INSERT INTO warnings VALUES($1,$2,$3,$4,$5,$6)",
-                (ctx.guild.id, member.id, ctx.author.id, mod_type, reason, warned_at))
-            self.db_conn.commit()
+            await self.bot.timers.cancel('tempmute', ctx.guild.id, member.id)
+            await log_action(self.db, ctx.guild.id, member.id, ctx.author.id, mod_type, reason)
             await ctx.send(f'Unmuted {member.mention}')
             with suppress(discord.HTTPException):
                 return await member.send(f'You were unmuted in {ctx.guild.name} for {reason}')
 
+    async def show_history(self, ctx, title, flags, user=None):
+        filters = dict(
+            user_id=(user or flags.user).id if (user or flags.user) else None,
+            mod_id=flags.mod.id if flags.mod else None,
+            mod_type=flags.type.title() if flags.type else None,
+            after=flags.after.timestamp() if flags.after else None,
+            before=flags.before.timestamp() if flags.before else None,
+        )
+        total = await count_history(self.db, ctx.guild.id, **filters)
+        if not total:
+            return await ctx.send('No moderation history found')
+        fetch = history_pager(self.db, ctx.guild.id, page_size=MODLOG_PAGE_SIZE, **filters)
+        first_page = await fetch()
+        pages = math.ceil(total / MODLOG_PAGE_SIZE)
+        def format_page(rows, number):
+            lines = []
+            for case_id, user_id, mod_id, mod_type, reason, created_at in rows:
+                when = f'<t:{created_at}:d>' if created_at else 'unknown date'
+                lines.append(f'`#{case_id}` **{mod_type}** <@{user_id}> by <@{mod_id}> on {when}\n{reason or "No reason provided"}'[:300])
+            em = discord.Embed(colour=self.bot.colour, title=title, description='\n'.join(lines))
+            em.set_footer(text=f'Page {number + 1}/{pages} ({total} entries)')
+            return em
+        if pages == 1:
+            return await ctx.send(embed=format_page(first_page, 0))
+        source = KeysetPageSource(fetch, format_page, first_page, page_count=pages, exact=True)
+        await MyMenu(source).start(ctx)
+
+    @commands.command(name='warnings', aliases=['warns', 'infractions'], help='A member\'s moderation history, filter with type: mod: after: before:')
+    @commands.has_guild_permissions(manage_messages=True)
+    @commands.bot_has_guild_permissions(send_messages=True, embed_links=True, add_reactions=True)
+    async def warnings(self, ctx, member: Union[SearchMember, discord.User], *, flags: ModLogFlags):
+        return await self.show_history(ctx, f'Moderation history of {member}', flags, user=member)
+
+    @commands.command(name='modlogs', aliases=['modlog', 'cases'], help='The server\'s moderation history, filter with type: mod: user: after: before:')
+    @commands.has_guild_permissions(manage_messages=True)
+    @commands.bot_has_guild_permissions(send_messages=True, embed_links=True, add_reactions=True)
+    async def modlogs(self, ctx, *, flags: ModLogFlags):
+        return await self.show_history(ctx, 'Moderation history', flags)
+
+    def stats_table(self, rows):
+        # Counts are bucketed by UTC day, so the first column is today so far rather than the last 24 hours
+        lines = [f'{"Type":<10}{"Today":>6}{"7d":>6}{"30d":>6}{"All":>7}']
+        totals = [0, 0, 0, 0]
+        for mod_type, *counts in rows:
+            lines.append(f'{mod_type:<10}' + ''.join(f'{n:>6}' for n in counts[:3]) + f'{counts[3]:>7}')
+            totals = [a + b for a, b in zip(totals, counts)]
+        lines.append(f'{"Total":<10}' + ''.join(f'{n:>6}' for n in totals[:3]) + f'{totals[3]:>7}')
+        return '```\n' + '\n'.join(lines) + '\n```'
+
+    @commands.group(name='modstats', invoke_without_command=True, help='How many actions a moderator has taken')
+    @commands.has_guild_permissions(manage_messages=True)
+    @commands.bot_has_guild_permissions(send_messages=True, embed_links=True)
+    async def modstats(self, ctx, *, moderator: Union[SearchMember, discord.User]=None):
+        moderator = moderator or ctx.author
+        rows = await mod_stats(self.db, ctx.guild.id, moderator.id)
+        if not rows:
+            return await ctx.send(f'**{moderator}** hasn\'t taken any actions here')
+        em = discord.Embed(colour=self.bot.colour, title=f'Moderation stats for {moderator}', description=self.stats_table(rows))
+        return await ctx.send(embed=em)
+
+    @modstats.command(name='server', aliases=['guild'], help='How many actions the server\'s moderators have taken')
+    @commands.has_guild_permissions(manage_messages=True)
+    @commands.bot_has_guild_permissions(send_messages=True, embed_links=True)
+    async def modstats_server(self, ctx):
+        rows = await mod_stats(self.db, ctx.guild.id)
+        if not rows:
+            return await ctx.send('No actions have been taken here')
+        em = discord.Embed(colour=self.bot.colour, title=f'Moderation stats for {ctx.guild.name}', description=self.stats_table(rows))
+        top = await top_moderators(self.db, ctx.guild.id)
+        if top:
+            em.add_field(name='Top moderators (30d)', value='\n'.join(f'<@{mod_id}>: **{count}**' for mod_id, count in top))
+        return await ctx.send(embed=em)
+
+    @modstats.command(name='rebuild', hidden=True, help='Recompute the stats counters from the mod log')
+    @commands.is_owner()
+    async def modstats_rebuild(self, ctx):
+        buckets = await self.db.transaction(rebuild_mod_stats)
+        return await ctx.send(f'Rebuilt **{buckets}** stats buckets from the mod log')
+
 async def setup(bot):
     await bot.add_cog(Moderation(bot))
\ No newline at end of file
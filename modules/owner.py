@@ -0,0 +1,73 @@
+import discord
+import time
+from discord.ext import commands
+
+class Owner(commands.Cog, name='owner', description='Owner Commands', command_attrs=dict(hidden=True)):
+    def __init__(self, bot):
+        self.bot = bot
+        self.colour = bot.colour
+
+    async def cog_check(self, ctx):
+        if not await self.bot.is_owner(ctx.author):
+            raise commands.NotOwner()
+        return True
+
+    def command_table(self, by_command, n):
+        # Most total time first, that's where speeding things up pays off
+        rows = sorted(by_command.items(), key=lambda item: item[1].latency.sum, reverse=True)[:n]
+        lines = [f'{"Command":<18}{"Calls":>6}{"p50":>7}{"p99":>7}{"Err":>5}{"DB":>7}{"HTTP":>7}']
+        for name, stats in rows:
+            calls = stats.latency.count
+            errors = sum(stats.errors.values())
+            per_call = lambda seconds: f'{seconds / calls * 1000:.1f}' if calls else '-'
+            lines.append(f'{name[:17]:<18}{calls:>6}{stats.latency.quantile(0.5) * 1000:>7.0f}'
+                f'{stats.latency.quantile(0.99) * 1000:>7.0f}{errors:>5}{per_call(stats.db):>7}{per_call(stats.http):>7}')
+        return '```\n' + '\n'.join(lines) + '\n```'
+
+    def summary(self, histograms):
+        return '\n'.join(f'{name}: **{h.count}**, p50 {h.quantile(0.5) * 1000:.0f}ms, p99 {h.quantile(0.99) * 1000:.0f}ms'
+            for name, h in sorted(histograms.items())) or 'Nothing yet'
+
+    @commands.command(name='stats', help='Command latency, errors and time spent on the db and HTTP')
+    @commands.bot_has_permissions(send_messages=True, embed_links=True)
+    async def stats(self, ctx, n: int=15):
+        metrics = self.bot.metrics
+        if not metrics.commands:
+            return await ctx.send('No commands have run yet')
+        hours = (time.time() - metrics.started) / 3600
+        em = discord.Embed(colour=self.colour, title=f'Command stats, last {hours:.1f}h',
+            description=self.command_table(metrics.commands, max(1, min(n, 25))))
+        em.add_field(name='Database', value=self.summary(metrics.db))
+        em.add_field(name='HTTP', value=self.summary(metrics.http))
+        em.set_footer(text='Times in ms, DB and HTTP are averages per call. Percentiles are estimated from histogram buckets.')
+        return await ctx.send(embed=em)
+
+    @commands.group(name='stalls', invoke_without_command=True, help='Where the event loop has been blocked')
+    @commands.bot_has_permissions(send_messages=True, embed_links=True)
+    async def stalls(self, ctx, n: int=10):
+        watchdog = self.bot.watchdog
+        lag = watchdog.lag
+        em = discord.Embed(colour=self.colour, title='Event loop stalls')
+        em.description = (f'**{watchdog.stalls}** stalls over {watchdog.threshold * 1000:.0f}ms. '
+            f'Loop lag p50 {lag.quantile(0.5) * 1000:.1f}ms, p99 {lag.quantile(0.99) * 1000:.1f}ms '
+            f'over {lag.count} beats')
+        for rank, (site, stats) in enumerate(watchdog.worst(max(1, min(n, 20))), start=1):
+            em.add_field(name=f'{rank}. {site}'[:256], inline=False,
+                value=f'**{stats.count}** stalls, {stats.total * 1000:.0f}ms in all, worst {stats.worst * 1000:.0f}ms')
+        em.set_footer(text=f'{ctx.prefix}stalls stack <rank> for the worst stack of one')
+        return await ctx.send(embed=em)
+
+    @stalls.command(name='stack', help='The stack of the worst stall at one site')
+    @commands.bot_has_permissions(send_messages=True)
+    async def stalls_stack(self, ctx, rank: int=1):
+        worst = self.bot.watchdog.worst(rank)
+        if rank < 1 or len(worst) < rank:
+            return await ctx.send('No stall site ranked that')
+        site, stats = worst[rank - 1]
+        if stats.stack is None:
+            return await ctx.send(f'No stack was caught for `{site}`')
+        # The innermost frames are the interesting ones
+        return await ctx.send(f'`{site}`, {stats.worst * 1000:.0f}ms\n```\n{stats.stack[-1800:].rstrip()}\n```')
+
+async def setup(bot):
+    await bot.add_cog(Owner(bot))
@@ -1,15 +1,80 @@
+import asyncio
 import discord
 import datetime
+import itertools
+import time
+from collections import OrderedDict
 from discord.ext import commands
 from utils.converters import SearchMember
+from utils.cache import LRUCache
+from utils.textindex import NameIndex
+from utils.menus import MyMenu, KeysetPageSource
+
+TAG_PAGE_SIZE = 40
+
+# A guild's trigram index goes once nobody has searched its tags for this long
+TRIGRAM_IDLE = 600
+
+# tag grep only ranks a search with fewer matches than this. BM25 has to score every
+# match before it can sort, for a very common word that's slower than a LIKE scan,
+# while taking the first 10 matches stops early.
+GREP_RANK_LIMIT = 500
 
 class Tags(commands.Cog, name='tags', description='Tag Commands'):
     def __init__(self, bot):
         self.bot = bot
         self.colour = bot.colour
-        self.db_conn = bot.db_conn
-        self.db_c = bot.db_c
-        self.db_c.execute('''CREATE TABLE IF NOT EXISTS tags(guild_id, author_id, uses, name, content, creation)''')
+        self.db = bot.db
+        # Hot tag content keyed by (guild_id, lookup)
+        self.tag_cache = LRUCache(max_entries=4096, max_bytes=8 * 1024 * 1024, sizeof=lambda c: len(c.encode('utf-8')))
+        # Every tag name per guild, so lookups for tags that don't exist never reach the db
+        self.tag_names = {}
+        # guild_id -> when its trigrams were last used, least recent first
+        self.trigram_guilds = OrderedDict()
+        self.short_circuited = 0
+
+    async def cog_load(self):
+        rows = await self.db.fetchall("SELECT guild_id, name FROM tags ORDER BY guild_id, name")
+        # Just the sorted names, trigrams come later per guild, see fuzzy_index
+        self.tag_names = await asyncio.to_thread(_group_names, rows)
+
+    async def fuzzy_index(self, guild_id):
+        """A guild's NameIndex with its trigrams built, or None if it has no tags."""
+        index = self.tag_names.get(guild_id)
+        if index is None:
+            return None
+        await index.build_trigrams()
+        now = time.monotonic()
+        self.trigram_guilds[guild_id] = now
+        self.trigram_guilds.move_to_end(guild_id)
+        # Good moment to free the guilds nobody is searching any more, they're all at the front
+        while self.trigram_guilds:
+            other_id, last_used = next(iter(self.trigram_guilds.items()))
+            if last_used >= now - TRIGRAM_IDLE:
+                break
+            del self.trigram_guilds[other_id]
+            other = self.tag_names.get(other_id)
+            if other is not None:
+                other.drop_trigrams()
+        return index
+
+    def may_exist(self, guild_id, lookup):
+        index = self.tag_names.get(guild_id)
+        if index is None or lookup not in index:
+            self.short_circuited += 1
+            return False
+        return True
+
+    def index_tag(self, guild_id, lookup):
+        index = self.tag_names.get(guild_id)
+        if index is None:
+            index = self.tag_names[guild_id] = NameIndex()
+        index.add(lookup)
+
+    def unindex_tag(self, guild_id, lookup):
+        index = self.tag_names.get(guild_id)
+        if index is not None:
+            index.discard(lookup)
 
     def clean_tag_content(self, content):
         return content.replace('@everyone', '@\u200beveryone').replace('@here', '@\u200bhere')
@@ -24,18 +89,36 @@ class Tags(commands.Cog, name='tags', description='Tag Commands'):
         if len(lookup) > 50:
             raise RuntimeError('Tag name is a maximum of 50 characters.')
 
+    async def get_tag_content(self, guild_id, lookup):
+        if not self.may_exist(guild_id, lookup):
+            return None
+        key = (guild_id, lookup)
+        content = self.tag_cache.get(key)
+        if content is not None:
+            return content
+        generation = self.tag_cache.generation
+        t = await self.db.fetchone("SELECT content FROM tags WHERE name=? AND guild_id=?", (lookup, guild_id))
+        if t is None:
+            return None
+        # Skipped if the tag was changed while we were reading it
+        self.tag_cache.put(key, t[0], generation=generation)
+        return t[0]
+
     async def do_tag_stuff(self, ctx, name):
         lookup = name.lower()
         if not ctx.guild:
             raise commands.NoPrivateMessage
         else:
-            self.db_c.execute("SELECT content FROM tags WHERE name=$1 AND guild_id=$2", (lookup, ctx.guild.id))
-            t = self.db_c.fetchone()
-            if t is None:
+            content = await self.get_tag_content(ctx.guild.id, lookup)
+            if content is None:
+                index = await self.fuzzy_index(ctx.guild.id)
+                suggestions = index.fuzzy(lookup, limit=3) if index else []
+                if suggestions:
+                    suggestions = ', '.join(f'**{s}**' for s in suggestions)
+                    return await ctx.send(f'Tag **{lookup}** doesn\'t exist, did you mean {suggestions}?')
                 return await ctx.send(f'Tag **{lookup}** doesn\'t exist')
-            await ctx.send(t[0])
-            self.db_c.execute("UPDATE tags SET uses = uses + 1 WHERE name=$1 AND guild_id=$2", (lookup, ctx.guild.id))
-            self.db_conn.commit()
+            await ctx.send(content)
+            self.bot.tag_uses.add(ctx.guild.id, lookup)
         
     @commands.group(name='tag', invoke_without_command=True, help='Look for a tag')
     @commands.bot_has_guild_permissions(send_messages=True, embed_links=True)
@@ -63,13 +146,12 @@ class Tags(commands.Cog, name='tags', description='Tag Commands'):
             self.verify_lookup(lookup)
         except RuntimeError as e:
             return await ctx.send('A RunTimeError has occurred, try again')
-        self.db_c.execute("SELECT name FROM tags WHERE name=$1 AND guild_id=$2", (lookup, ctx.guild.id))
-        result = self.db_c.fetchone()
-        if result:
+        created = await self.db.transaction(_insert_tag,
+            ctx.guild.id, ctx.author.id, lookup, content, datetime.datetime.utcnow().strftime("%d %b %Y %H:%M"))
+        if not created:
             return await ctx.send('A tag with that name already exists')
-        self.db_c.execute("INSERT INTO tags VALUES($1,$2,$3,$4,$5,$6)",
-            (ctx.guild.id, ctx.author.id, 0, name, content, datetime.datetime.utcnow().strftime("%d %b %Y %H:%M")))
-        self.db_conn.commit()
+        self.tag_cache.invalidate((ctx.guild.id, lookup))
+        self.index_tag(ctx.guild.id, lookup)
         return await ctx.send(f'Created tag **{name}**')
 
     @tag.command(name='edit', help='Edit a tag', aliases=['update'])
@@ -83,15 +165,13 @@ class Tags(commands.Cog, name='tags', description='Tag Commands'):
             self.verify_lookup(lookup)
         except RuntimeError as e:
             return await ctx.send('A RunTimeError has occurred, try again')
-        self.db_c.execute("SELECT name FROM tags WHERE name=$1 AND guild_id=$2", (lookup, ctx.guild.id))
-        result = self.db_c.fetchone()
-        if result is None:
+        updated = await self.db.transaction(_update_tag_content, ctx.guild.id, lookup, content)
+        if not updated:
             return await ctx.send('A tag with that name doesn\'t exist')
-        self.db_c.execute("UPDATE tags SET content=$1 WHERE name=$2 AND guild_id=$3",(content, lookup, ctx.guild.id))
-        self.db_conn.commit()
+        self.tag_cache.invalidate((ctx.guild.id, lookup))
         return await ctx.send(f'Edited tag **{name}**')
 
-    @tag.command(name='append', help='Add something to an existing tag. A newline will be inserted.', aliases=['+=', 'add'])
+    @tag.command(name='append', help='Add something to an existing tag. A newline will be inserted.', aliases=['+='])
     @commands.bot_has_guild_permissions(send_messages=True, embed_links=True)
     async def tag_append(self, ctx, name: str, *, content: str):
         if ctx.message.mentions:
@@ -102,42 +182,36 @@ class Tags(commands.Cog, name='tags', description='Tag Commands'):
             self.verify_lookup(lookup)
         except RuntimeError as e:
             return await ctx.send('A RunTimeError has occurred, try again')
-        self.db_c.execute("SELECT name FROM tags WHERE name=$1 AND guild_id=$2", (lookup, ctx.guild.id))
-        result = self.db_c.fetchone()
+        # Checked and appended in one go on the writer thread, so concurrent appends can't drop each other
+        result = await self.db.transaction(_append_tag_content, ctx.guild.id, lookup, content)
         if result is None:
             return await ctx.send('A tag with that name doesn\'t exist')
-        self.db_c.execute("SELECT content FROM tags WHERE name=$1 AND guild_id=$2", (lookup, ctx.guild.id))
-        content_result = self.db_c.fetchone()
-        appended_tag = content_result[0] + '\n{}'.format(content)
-        if len(appended_tag) >= 2000:
-                len_orig = len(content_result[0])
-                return await ctx.send(f'That would make the tag too long (2000 characters), the original tag\'s length is {len_orig} characters')
-        self.db_c.execute("UPDATE tags SET content=$1 WHERE name=$2 AND guild_id=$3", (appended_tag, lookup, ctx.guild.id))
-        self.db_conn.commit()
+        appended, len_orig = result
+        if not appended:
+            return await ctx.send(f'That would make the tag too long (2000 characters), the original tag\'s length is {len_orig} characters')
+        self.tag_cache.invalidate((ctx.guild.id, lookup))
         return await ctx.send(f'Appended tag **{name}**')
     
     @tag.command(name='delete', aliases=['-', 'remove', 'del'], help='Delete a tag')
     @commands.bot_has_guild_permissions(send_messages=True, embed_links=True)
     async def tag_delete(self, ctx, *, name: str):
         lookup = name.lower()
-        self.db_c.execute("SELECT name FROM tags WHERE name=$1 AND guild_id=$2", (lookup, ctx.guild.id))
-        result = self.db_c.fetchone()
-        if result is None:
+        deleted = await self.db.transaction(_delete_tag, ctx.guild.id, lookup)
+        if not deleted:
             return await ctx.send('A tag with that name doesn\'t exist')
-        self.db_c.execute("DELETE FROM tags WHERE name=$1 AND guild_id=$2", (lookup, ctx.guild.id))
-        self.db_conn.commit()
+        self.bot.tag_uses.discard(ctx.guild.id, lookup)
+        self.tag_cache.invalidate((ctx.guild.id, lookup))
+        self.unindex_tag(ctx.guild.id, lookup)
         return await ctx.send(f'Deleted tag **{name}**')
 
     @tag.command(name='info', help='Displays information about a tag')
     @commands.bot_has_guild_permissions(send_messages=True, embed_links=True)
     async def tag_info(self, ctx, name: str):
         lookup = name.lower()
-        self.db_c.execute("SELECT name FROM tags WHERE name=$1 AND guild_id=$2", (lookup, ctx.guild.id))
-        result = self.db_c.fetchone()
+        result = await self.db.fetchone("SELECT name FROM tags WHERE name=? AND guild_id=?", (lookup, ctx.guild.id))
         if result is None:
             return await ctx.send('A tag with that name doesn\'t exist')
-        self.db_c.execute("SELECT * FROM tags WHERE name=$1 AND guild_id=$2", (lookup, ctx.guild.id))
-        result = self.db_c.fetchone()
+        result = await self.db.fetchone("SELECT * FROM tags WHERE name=? AND guild_id=?", (lookup, ctx.guild.id))
         owner_id = result[1]
         uses = result[2]
         date = result[5]
@@ -149,78 +223,202 @@ class Tags(commands.Cog, name='tags', description='Tag Commands'):
         if not owner:
             owner = self.bot.get_user(owner_id)
         embed.add_field(name='Owner', value=owner.mention, inline=False)
+        # Views that haven't been written out yet
+        uses += self.bot.tag_uses.pending(ctx.guild.id, lookup)
         embed.add_field(name='Uses', value=round(uses), inline=False)
-        self.db_c.execute("SELECT uses FROM tags WHERE guild_id=$1", (ctx.guild.id,))
-        rank_result = self.db_c.fetchall()
-        rank = sorted([x[0] for x in rank_result], reverse=True).index(uses) + 1
+        # Tied tags share a rank
+        higher = await self.db.fetchone("SELECT COUNT(*) FROM tags WHERE guild_id=? AND uses > ?", (ctx.guild.id, uses))
+        rank = higher[0] + 1
         embed.add_field(name='Rank', value=rank, inline=False)
         embed.set_footer(text=f'Tag created on {date}')
         return await ctx.send(embed=embed)
 
-    async def tag_list_stuff(self, ctx, tags):
-        tags = [x[0] for x in tags]
-        if sum(len(t) for t in tags) < 1900:
-            d = ', '.join(tags)
-            try:
-                return await ctx.author.send(d)
-            except:
-                return await ctx.send(d)
+    @tag.command(name='top', help='Shows the most used tags', aliases=['leaderboard', 'lb'])
+    @commands.bot_has_guild_permissions(send_messages=True, embed_links=True)
+    async def tag_top(self, ctx, n: int=10):
+        n = max(1, min(n, 25))
+        rows = await self.db.fetchall("SELECT name, uses FROM tags WHERE guild_id=? ORDER BY uses DESC, name LIMIT ?", (ctx.guild.id, n))
+        if not rows:
+            return await ctx.send('This server has created no tags')
+        lines = []
+        rank = 0
+        for position, (name, uses) in enumerate(rows, start=1):
+            if position == 1 or uses != rows[position - 2][1]:
+                rank = position
+            lines.append(f'**{rank}.** {name} ({uses} uses)')
+        embed = discord.Embed(
+            colour=self.colour,
+            title=f'Top {len(rows)} tags',
+            description='\n'.join(lines)
+        )
+        return await ctx.send(embed=embed)
+
+    @tag.command(name='search', help='Search for tags by name')
+    @commands.bot_has_guild_permissions(send_messages=True, embed_links=True)
+    async def tag_search(self, ctx, *, query: str):
+        query = query.lower().strip()
+        if len(query) > 50:
+            return await ctx.send('Tag name is a maximum of 50 characters')
+        index = await self.fuzzy_index(ctx.guild.id)
+        results = index.search(query, limit=20) if index else []
+        if not results:
+            return await ctx.send(f'No tags found for **{query}**')
+        embed = discord.Embed(
+            colour=self.colour,
+            title=f'Tags matching {query}',
+            description='\n'.join(results)
+        )
+        return await ctx.send(embed=embed)
+
+    @tag.command(name='grep', help='Search for tags by their content')
+    @commands.bot_has_guild_permissions(send_messages=True, embed_links=True)
+    async def tag_grep(self, ctx, *, terms: str):
+        # Quote every term so FTS5 query syntax in user input is matched literally, and keep
+        # them to name and content, a number would otherwise match some guild's guild_id
+        query = ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms.split())
+        match = f'guild_id:{ctx.guild.id} AND {{name content}}: ({query})'
+        row = await self.db.fetchone("SELECT COUNT(*) FROM (SELECT rowid FROM tags_fts WHERE tags_fts MATCH ? LIMIT ?)",
+            (match, GREP_RANK_LIMIT))
+        ranked = row[0] < GREP_RANK_LIMIT
+        if ranked:
+            rows = await self.db.fetchall('''SELECT name, snippet(tags_fts, 1, '**', '**', '...', 12)
+                FROM tags_fts WHERE tags_fts MATCH ?
+                ORDER BY bm25(tags_fts, 2.0, 1.0, 0.0) LIMIT 10''', (match,))
         else:
-            tempmessage = []
-            finalmessage = []
-            for tag in tags:
-                if len(', '.join(tempmessage)) < 1800:
-                    tempmessage.append(tag)
-                else:
-                    formatted_tempmessage = ', '.join(tempmessage)
-                    finalmessage.append(formatted_tempmessage)
-                    tempmessage = []
-            finalmessage.append(', '.join(tempmessage))
-            for x in finalmessage:
-                if x != "":
-                    try:
-                        return await ctx.author.send(x)
-                    except:
-                        return await ctx.send(x)
+            rows = await self.db.fetchall('''SELECT name, snippet(tags_fts, 1, '**', '**', '...', 12)
+                FROM tags_fts WHERE tags_fts MATCH ? LIMIT 10''', (match,))
+        if not rows:
+            return await ctx.send(f'No tags mention **{terms}**')
+        embed = discord.Embed(
+            colour=self.colour,
+            title=f'Tags mentioning {terms}'
+        )
+        for name, snippet in rows:
+            embed.add_field(name=name, value=snippet[:1024] or '\u200b', inline=False)
+        if not ranked:
+            embed.set_footer(text=f'{GREP_RANK_LIMIT}+ matches, these are the first 10 rather than the best')
+        return await ctx.send(embed=embed)
+
+    @tag.command(name='cache', hidden=True, help='Tag content cache stats')
+    @commands.is_owner()
+    async def tag_cache_stats(self, ctx):
+        stats = self.tag_cache.stats
+        return await ctx.send(
+            f'**{stats["entries"]}** tags cached ({stats["bytes"] / 1024:.1f} KiB), '
+            f'hit rate **{stats["hit_rate"]:.1%}** ({stats["hits"]} hits, {stats["misses"]} misses), '
+            f'**{stats["evictions"]}** evictions, '
+            f'**{self.short_circuited}** lookups for missing tags skipped the db'
+        )
+
+    def tag_pager(self, where, params):
+        # Keyset pagination on (guild_id, name), only ever one page of names in memory
+        async def fetch(after=None):
+            rows = await self.db.fetchall(f"SELECT name FROM tags WHERE {where} AND name > ? ORDER BY name ASC LIMIT ?",
+                (*params, after or '', TAG_PAGE_SIZE))
+            return [row[0] for row in rows]
+        return fetch
+
+    async def tag_list_stuff(self, ctx, title, where, params):
+        fetch = self.tag_pager(where, params)
+        first_page = await fetch()
+        if not first_page:
+            return False
+        def format_page(names, number):
+            embed = discord.Embed(
+                colour=self.colour,
+                title=title,
+                description=', '.join(names)
+            )
+            embed.set_footer(text=f'Page {number + 1}')
+            return embed
+        # Listings go to the author's DMs as they always have, the channel only gets them if those are closed
+        try:
+            await self.send_listing(ctx, await ctx.author.create_dm(), fetch, format_page, first_page)
+        except discord.Forbidden:
+            await self.send_listing(ctx, ctx.channel, fetch, format_page, first_page)
+        return True
+
+    async def send_listing(self, ctx, channel, fetch, format_page, first_page):
+        if len(first_page) < TAG_PAGE_SIZE:
+            await channel.send(embed=format_page(first_page, 0))
+        else:
+            await MyMenu(KeysetPageSource(fetch, format_page, first_page)).start(ctx, channel=channel)
 
     @tag.command(name='mine', help='Shows all tags a member has created')
-    @commands.bot_has_guild_permissions(send_messages=True, embed_links=True)
+    @commands.bot_has_guild_permissions(send_messages=True, embed_links=True, add_reactions=True)
     async def tag_mine(self, ctx, *, user: SearchMember=None):
         user = user or ctx.author
-        self.db_c.execute("SELECT name FROM tags WHERE guild_id=$1 AND author_id=$2 ORDER BY name ASC", (ctx.guild.id, user.id))
-        tags = self.db_c.fetchall()
-        if len(tags) == 0:
+        if not await self.tag_list_stuff(ctx, f'Tags by {user}', 'guild_id=? AND author_id=?', (ctx.guild.id, user.id)):
             return await ctx.send('This user has created no tags')
-        return await self.tag_list_stuff(ctx, tags)
 
     @tag.command(name='list', help='Shows you the names of all tags')
-    @commands.bot_has_guild_permissions(send_messages=True)
+    @commands.bot_has_guild_permissions(send_messages=True, embed_links=True, add_reactions=True)
     async def tag_list(self, ctx):
-        self.db_c.execute("SELECT name FROM tags WHERE guild_id=$1 AND LENGTH(name) > 2 ORDER BY name ASC", (ctx.guild.id,))
-        tags = self.db_c.fetchall()
-        if len(tags) == 0:
+        if not await self.tag_list_stuff(ctx, 'Tags', 'guild_id=? AND LENGTH(name) > 2', (ctx.guild.id,)):
             return await ctx.send('This server has created no tags')
-        return await self.tag_list_stuff(ctx, tags)
 
     @commands.command(name='tags', help='Shows you the names of all tags', aliases=['taglist'])
-    @commands.bot_has_guild_permissions(send_messages=True)
+    @commands.bot_has_guild_permissions(send_messages=True, embed_links=True, add_reactions=True)
     async def tags(self, ctx):
-        self.db_c.execute("SELECT name FROM tags WHERE guild_id=$1 AND LENGTH(name) > 2 ORDER BY name ASC", (ctx.guild.id,))
-        tags = self.db_c.fetchall()
-        if len(tags) == 0:
+        if not await self.tag_list_stuff(ctx, 'Tags', 'guild_id=? AND LENGTH(name) > 2', (ctx.guild.id,)):
             return await ctx.send('This server has created no tags')
-        return await self.tag_list_stuff(ctx, tags)
 
     @tag.command(name='random', help='Show a random tag')
     @commands.bot_has_guild_permissions(send_messages=True, embed_links=True)
     async def tag_random(self, ctx):
-        self.db_c.execute("SELECT name FROM tags WHERE guild_id=$1 ORDER BY RANDOM() LIMIT 1", (ctx.guild.id,))
-        tag = self.db_c.fetchone()
+        tag = await self.db.fetchone("SELECT name FROM tags WHERE guild_id=? ORDER BY RANDOM() LIMIT 1", (ctx.guild.id,))
         if tag is None:
             return await ctx.send('This server has created no tags')
-        self.db_c.execute("UPDATE tags SET uses = uses + 1 WHERE guild_id=$1 AND name=$2", (ctx.guild.id, tag[0]))
-        self.db_conn.commit()
+        self.bot.tag_uses.add(ctx.guild.id, tag[0])
         return await ctx.send(tag[0])
 
+# These run on the database's writer thread so the tag and its search entry change together
+
+def _insert_tag(cur, guild_id, author_id, lookup, content, creation):
+    cur.execute('''INSERT INTO tags(guild_id, author_id, uses, name, content, creation) VALUES(?,?,0,?,?,?)
+        ON CONFLICT(guild_id, name) DO NOTHING''', (guild_id, author_id, lookup, content, creation))
+    if not cur.rowcount:
+        return False
+    cur.execute("INSERT INTO tags_fts(rowid, name, content, guild_id) VALUES(?,?,?,?)", (cur.lastrowid, lookup, content, guild_id))
+    return True
+
+def _update_tag_content(cur, guild_id, lookup, content):
+    row = cur.execute("SELECT id, content FROM tags WHERE guild_id=? AND name=?", (guild_id, lookup)).fetchone()
+    if row is None:
+        return False
+    tag_id, old_content = row
+    cur.execute("INSERT INTO tags_fts(tags_fts, rowid, name, content, guild_id) VALUES('delete',?,?,?,?)", (tag_id, lookup, old_content, guild_id))
+    cur.execute("UPDATE tags SET content=? WHERE id=?", (content, tag_id))
+    cur.execute("INSERT INTO tags_fts(rowid, name, content, guild_id) VALUES(?,?,?,?)", (tag_id, lookup, content, guild_id))
+    return True
+
+def _append_tag_content(cur, guild_id, lookup, content):
+    """None if there's no such tag, else (appended, length of the original content)."""
+    row = cur.execute("SELECT id, content FROM tags WHERE guild_id=? AND name=?", (guild_id, lookup)).fetchone()
+    if row is None:
+        return None
+    tag_id, old_content = row
+    new_content = f'{old_content}\n{content}'
+    if len(new_content) >= 2000:
+        return False, len(old_content)
+    cur.execute("INSERT INTO tags_fts(tags_fts, rowid, name, content, guild_id) VALUES('delete',?,?,?,?)", (tag_id, lookup, old_content, guild_id))
+    cur.execute("UPDATE tags SET content = content || char(10) || ? WHERE id=?", (content, tag_id))
+    cur.execute("INSERT INTO tags_fts(rowid, name, content, guild_id) VALUES(?,?,?,?)", (tag_id, lookup, new_content, guild_id))
+    return True, len(old_content)
+
+def _delete_tag(cur, guild_id, lookup):
+    row = cur.execute("SELECT id, content FROM tags WHERE guild_id=? AND name=?", (guild_id, lookup)).fetchone()
+    if row is None:
+        return False
+    tag_id, old_content = row
+    cur.execute("INSERT INTO tags_fts(tags_fts, rowid, name, content, guild_id) VALUES('delete',?,?,?,?)", (tag_id, lookup, old_content, guild_id))
+    cur.execute("DELETE FROM tags WHERE id=?", (tag_id,))
+    return True
+
+def _group_names(rows):
+    # Rows come sorted by guild, then name
+    return {guild_id: NameIndex(name for _, name in group)
+        for guild_id, group in itertools.groupby(rows, key=lambda row: row[0])}
+
 async def setup(bot):
     await bot.add_cog(Tags(bot))
\ No newline at end of file
@@ -0,0 +1,54 @@
+import asyncio
+import contextlib
+import io
+import unittest
+from types import SimpleNamespace
+
+import discord
+
+from utils.bulkroles import BulkRoleJob
+
+class FakeClient:
+    """Every role change succeeds, except for the members in `broken`, which raise `error`."""
+    def __init__(self, broken=(), error=ValueError):
+        self.broken = set(broken)
+        self.error = error
+        self.calls = []
+
+    async def mutate(self, guild_id, user_id, role_id, add, reason=None):
+        self.calls.append(user_id)
+        await asyncio.sleep(0)
+        if user_id in self.broken:
+            if issubclass(self.error, discord.HTTPException):
+                raise self.error(SimpleNamespace(status=404, reason='Not Found'), 'Unknown Member')
+            raise self.error('bad response')
+
+class BulkRoleJobTest(unittest.IsolatedAsyncioTestCase):
+    async def run_job(self, client, member_ids):
+        job = BulkRoleJob(client, 1, 2, True, member_ids, concurrency=5)
+        with contextlib.redirect_stderr(io.StringIO()):
+            await asyncio.wait_for(job.run(), 5)
+        return job
+
+    async def test_all_succeed(self):
+        job = await self.run_job(FakeClient(), list(range(1, 101)))
+        self.assertEqual((job.done, job.failed), (100, 0))
+        self.assertEqual(job.cursor, 100)
+
+    async def test_client_error_counts_as_failure(self):
+        client = FakeClient(broken={1, 50}, error=ValueError)
+        job = await self.run_job(client, list(range(1, 101)))
+        self.assertEqual((job.done, job.failed), (98, 2))
+        self.assertEqual(job.cursor, 100)
+        self.assertEqual(client.calls.count(1), 1)
+
+    async def test_http_error_counts_as_failure(self):
+        job = await self.run_job(FakeClient(broken={3}, error=discord.NotFound), list(range(1, 11)))
+        self.assertEqual((job.done, job.failed), (9, 1))
+
+    async def test_every_request_raises(self):
+        job = await self.run_job(FakeClient(broken=range(1, 11), error=RuntimeError), list(range(1, 11)))
+        self.assertEqual((job.done, job.failed), (0, 10))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import asyncio
+
+import discord
+
+from utils.members import GuildMembers
+
+class GuildBans:
+    """One guild's ban list, by user id and by name."""
+    def __init__(self, entries=()):
+        self.entries = {entry.user.id: entry for entry in entries}
+        self.names = GuildMembers(entry.user for entry in self.entries.values())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry):
+        self.entries[entry.user.id] = entry
+        self.names.add(entry.user)
+
+    def remove(self, user_id):
+        self.entries.pop(user_id, None)
+        self.names.remove(user_id)
+
+    def named(self, name):
+        """The ban of a user called exactly `name` (username, global name or name#discrim), or None."""
+        ids = self.names.owners.get(name.lower())
+        if not ids:
+            return None
+        return self.entries[min(ids)]
+
+    def search(self, query, limit=25):
+        results = []
+        for user_id in self.names.find(query, limit):
+            results.append(self.entries[user_id])
+            if len(results) >= limit:
+                break
+        return results
+
+class BanIndex:
+    """Ban lists fetched once per guild and kept current by the ban and unban events.
+
+    Bans and unbans that happen while a guild's list is still downloading are
+    held back and applied once it finishes, so nothing is missed.
+    """
+    def __init__(self):
+        self.guilds = {}
+        self._loading = {}
+        # guild id -> (added, ban entry or user id) seen while that guild is loading
+        self._changes = {}
+
+    def loaded(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    async def get(self, guild):
+        index = self.guilds.get(guild.id)
+        if index is not None:
+            return index
+        task = self._loading.get(guild.id)
+        if task is None:
+            task = self._loading[guild.id] = asyncio.create_task(self._load(guild))
+        # Shielded so one caller giving up doesn't cancel the download for everyone else
+        return await asyncio.shield(task)
+
+    async def _load(self, guild):
+        self._changes[guild.id] = []
+        try:
+            entries = [entry async for entry in guild.bans(limit=None)]
+            index = GuildBans(entries)
+            for added, value in self._changes[guild.id]:
+                if added:
+                    index.add(value)
+                else:
+                    index.remove(value)
+            self.guilds[guild.id] = index
+            return index
+        finally:
+            self._changes.pop(guild.id, None)
+            self._loading.pop(guild.id, None)
+
+    def ban(self, guild, user, reason=None):
+        entry = discord.BanEntry(user=user, reason=reason)
+        self._apply(guild.id, True, entry)
+
+    def unban(self, guild, user):
+        self._apply(guild.id, False, user.id)
+
+    def _apply(self, guild_id, added, value):
+        pending = self._changes.get(guild_id)
+        if pending is not None:
+            pending.append((added, value))
+        index = self.guilds.get(guild_id)
+        if index is None:
+            return
+        if added:
+            index.add(value)
+        else:
+            index.remove(value)
+
+    def drop(self, guild_id):
+        self.guilds.pop(guild_id, None)
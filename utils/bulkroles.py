@@ -0,0 +1,241 @@
+import asyncio
+import sys
+import time
+import traceback
+from contextlib import suppress
+
+import discord
+
+class RoleClient:
+    """Adds or removes a role through the bot's own HTTPClient.
+
+    So the requests share discord.py's per bucket rate limits and global
+    rate limit lock with everything else the bot does, and 429s and server
+    errors are retried there. Errors come out as discord.HTTPException.
+    """
+    def __init__(self, http):
+        self.http = http
+
+    async def mutate(self, guild_id, user_id, role_id, add, reason=None):
+        route = discord.http.Route('PUT' if add else 'DELETE', '/guilds/{guild_id}/members/{user_id}/roles/{role_id}',
+            guild_id=guild_id, user_id=user_id, role_id=role_id)
+        await self.http.request(route, reason=reason)
+
+class BulkRoleJob:
+    """Applies one role change to a list of members through a pool of workers.
+
+    `member_ids` must be sorted. `cursor` is the highest member id below
+    which every member has been handled, which is what gets saved so a
+    restart can carry on from there. Pacing is left to the client, the
+    workers just keep `concurrency` requests in flight.
+    """
+    def __init__(self, client, guild_id, role_id, add, member_ids, *, concurrency=5, reason=None):
+        self.client = client
+        self.guild_id = guild_id
+        self.role_id = role_id
+        self.add = add
+        self.member_ids = member_ids
+        self.concurrency = concurrency
+        self.reason = reason
+        self.done = 0
+        self.failed = 0
+        self.cursor = 0
+        self.started = None
+        self._next = 0
+        self._finished = bytearray(len(member_ids))
+        self._low = 0
+
+    @property
+    def handled(self):
+        return self.done + self.failed
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return self.handled / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        rate = self.rate
+        if not rate:
+            return None
+        return (len(self.member_ids) - self.handled) / rate
+
+    def _mark(self, i):
+        self._finished[i] = 1
+        while self._low < len(self.member_ids) and self._finished[self._low]:
+            self._low += 1
+        if self._low:
+            self.cursor = self.member_ids[self._low - 1]
+
+    async def _mutate(self, user_id):
+        try:
+            await self.client.mutate(self.guild_id, user_id, self.role_id, self.add, self.reason)
+        except discord.HTTPException:
+            # Gone, not allowed, or still failing after discord.py's retries
+            return False
+        except Exception:
+            # A closed session or a response that couldn't be read
+            print(f'Bulk role change for {user_id} failed:', file=sys.stderr)
+            traceback.print_exc()
+            return False
+        return True
+
+    async def _worker(self):
+        while self._next < len(self.member_ids):
+            i = self._next
+            self._next += 1
+            if await self._mutate(self.member_ids[i]):
+                self.done += 1
+            else:
+                self.failed += 1
+            self._mark(i)
+
+    async def run(self, on_progress=None, interval=3.0):
+        self.started = time.monotonic()
+        workers = [asyncio.create_task(self._worker()) for _ in range(max(1, min(self.concurrency, len(self.member_ids))))]
+        try:
+            if on_progress is None:
+                await asyncio.gather(*workers)
+                return
+            pending = set(workers)
+            while pending:
+                _, pending = await asyncio.wait(pending, timeout=interval)
+                await on_progress(self)
+            # Surface any worker error
+            for worker in workers:
+                worker.result()
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f'{hours}h {minutes}m'
+    if minutes:
+        return f'{minutes}m {seconds}s'
+    return f'{seconds}s'
+
+class BulkRoleManager:
+    """Runs `role addall`/`role removeall` jobs, one per guild, and keeps them in `role_jobs`."""
+    def __init__(self, bot, *, concurrency=5):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.tasks = {}
+        self.jobs = {}
+        self._resumed = False
+
+    def _client(self):
+        return RoleClient(self.bot.http)
+
+    def _targets(self, guild, role, add, cursor=0):
+        return sorted(
+            member.id for member in guild.members
+            if member.id > cursor and not member.bot and (role in member.roles) != add
+        )
+
+    async def start(self, ctx, role, add):
+        if ctx.guild.id in self.tasks:
+            return None
+        member_ids = self._targets(ctx.guild, role, add)
+        verb = 'Adding' if add else 'Removing'
+        message = await ctx.send(f'⏲️ {verb} **{role}** {"to" if add else "from"} **{len(member_ids)}** Members')
+        job_id = await self.bot.db.transaction(_insert_job,
+            ctx.guild.id, role.id, 'add' if add else 'remove', ctx.channel.id, message.id, ctx.author.id, len(member_ids))
+        self._spawn(job_id, ctx.guild, role, add, member_ids, ctx.channel.id, message.id, ctx.author, done=0, failed=0, total=len(member_ids))
+        return job_id
+
+    async def resume(self):
+        if self._resumed:
+            return
+        self._resumed = True
+        rows = await self.bot.db.fetchall('''SELECT id, guild_id, role_id, action, channel_id, message_id, author_id, cursor, done, failed, total
+            FROM role_jobs WHERE status='running' ''')
+        for job_id, guild_id, role_id, action, channel_id, message_id, author_id, cursor, done, failed, total in rows:
+            guild = self.bot.get_guild(guild_id)
+            role = guild and guild.get_role(role_id)
+            if role is None:
+                await self.bot.db.execute("UPDATE role_jobs SET status='cancelled' WHERE id=?", (job_id,))
+                continue
+            add = action == 'add'
+            author = guild.get_member(author_id)
+            member_ids = self._targets(guild, role, add, cursor)
+            self._spawn(job_id, guild, role, add, member_ids, channel_id, message_id, author, done=done, failed=failed, total=total)
+
+    def _spawn(self, job_id, guild, role, add, member_ids, channel_id, message_id, author, **counts):
+        reason = f'Bulk role change by {author}' if author else 'Bulk role change'
+        job = BulkRoleJob(self._client(), guild.id, role.id, add, member_ids, concurrency=self.concurrency, reason=reason)
+        self.jobs[guild.id] = (job_id, job)
+        self.tasks[guild.id] = asyncio.create_task(self._run(job_id, job, role, channel_id, message_id, **counts))
+
+    async def _save(self, job_id, job, done, failed, status='running'):
+        await self.bot.db.execute("UPDATE role_jobs SET status=?, cursor=?, done=?, failed=? WHERE id=?",
+            (status, job.cursor, done + job.done, failed + job.failed, job_id))
+
+    async def _run(self, job_id, job, role, channel_id, message_id, done, failed, total):
+        # done/failed are what earlier runs of this job got through before a restart
+        message = None
+        channel = self.bot.get_channel(channel_id)
+        if channel is not None:
+            message = channel.get_partial_message(message_id)
+        verb = 'Adding' if job.add else 'Removing'
+        direction = 'to' if job.add else 'from'
+
+        async def on_progress(job):
+            await self._save(job_id, job, done, failed)
+            if message is None:
+                return
+            handled = done + failed + job.handled
+            eta = job.eta
+            eta = format_duration(eta) if eta is not None else '?'
+            with suppress(discord.HTTPException):
+                await message.edit(content=f'⏲️ {verb} **{role}** {direction} **{total}** Members: '
+                    f'{handled}/{total} ({job.rate:.1f}/s, ETA {eta})')
+
+        try:
+            await job.run(on_progress)
+        except asyncio.CancelledError:
+            with suppress(Exception):
+                await self._save(job_id, job, done, failed)
+            raise
+        except Exception:
+            print(f'Bulk role job {job_id} failed:', file=sys.stderr)
+            traceback.print_exc()
+            await self._save(job_id, job, done, failed, 'failed')
+            return
+        finally:
+            self.tasks.pop(job.guild_id, None)
+            self.jobs.pop(job.guild_id, None)
+        await self._save(job_id, job, done, failed, 'done')
+        if message is not None:
+            past = 'Added' if job.add else 'Removed'
+            failures = f', {failed + job.failed} failed' if failed + job.failed else ''
+            with suppress(discord.HTTPException):
+                await message.reply(f'✅ {past} **{role}** {direction} **{done + job.done}** Members{failures}')
+
+    async def cancel(self, guild_id):
+        entry = self.jobs.get(guild_id)
+        task = self.tasks.get(guild_id)
+        if entry is None or task is None:
+            return None
+        job_id, job = entry
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+        await self.bot.db.execute("UPDATE role_jobs SET status='cancelled' WHERE id=?", (job_id,))
+        return job
+
+    async def stop(self):
+        # Leaves the jobs marked running so they pick up again next start
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _insert_job(cur, guild_id, role_id, action, channel_id, message_id, author_id, total):
+    cur.execute('''INSERT INTO role_jobs(guild_id, role_id, action, channel_id, message_id, author_id, total, created_at)
+        VALUES(?,?,?,?,?,?,?,?)''', (guild_id, role_id, action, channel_id, message_id, author_id, total, int(time.time())))
+    return cur.lastrowid
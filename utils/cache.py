@@ -0,0 +1,74 @@
+from collections import OrderedDict
+
+class LRUCache:
+    """A least recently used cache bounded by entry count and total size.
+
+    `sizeof` measures a value in bytes. `generation` goes up on every
+    invalidation, so a reader can note it before a slow fetch and skip
+    caching the result if something was invalidated in the meantime.
+    """
+    def __init__(self, max_entries=2048, max_bytes=4 * 1024 * 1024, sizeof=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self.bytes = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            value, size = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, generation=None):
+        if generation is not None and generation != self.generation:
+            return
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self._data[key] = (value, size)
+        self.bytes += size
+        while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted) = self._data.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self.generation += 1
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+
+    def clear(self):
+        self.generation += 1
+        self._data.clear()
+        self.bytes = 0
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._data),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -1,7 +1,10 @@
 import discord
 import re
+from datetime import datetime, timedelta, timezone
 from discord.ext import commands
-from discord.ext.commands.errors import NoPrivateMessage, RoleNotFound, MemberNotFound
+from discord.ext.commands.errors import NoPrivateMessage, RoleNotFound
+from utils.members import NOT_INDEXED
+from utils.roles import RoleIndex
 
 class SearchMember(commands.MemberConverter):
     """A Member Converter to replace `discord.Member`
@@ -9,45 +12,96 @@ class SearchMember(commands.MemberConverter):
     For example a user can input 'Josh' for 'Josh Stevens'.
     Also works for Nicknames.
     Is not case sensitive.
+    Names are looked up in `bot.member_names` (utils.members) so this only
+    scans the cache or goes to the gateway while a guild isn't indexed.
     """
+    async def convert(self, ctx, argument):
+        index = getattr(ctx.bot, 'member_names', None)
+        guild = ctx.guild
+        if guild is None or self._get_id_match(argument) or re.match(r'<@!?([0-9]{15,20})>$', argument):
+            # Ids and mentions are a dict lookup already, and DMs have no index
+            return await super().convert(ctx, argument)
+        if index is not None:
+            member = index.search(guild, argument)
+            if member is not NOT_INDEXED:
+                if member is None:
+                    raise commands.MemberNotFound(argument)
+                return member
+        # Not indexed (yet), the scan of the cache is all there is before asking the gateway
+        member = guild.get_member_named(argument) or await self.query_member_named(guild, argument)
+        if member is None:
+            raise commands.MemberNotFound(argument)
+        return member
+
     async def query_member_named(self, guild, argument):
-        cache = guild._state.member_cache_flags.joined
-        members = await guild.query_members(argument, limit=100, cache=cache)
         if len(argument) > 5 and argument[-5] == '#':
+            # name#discrim, which get_member_named has already tried on the cache
             username, _, discriminator = argument.rpartition('#')
+            if guild.chunked:
+                return None
+            cache = guild._state.member_cache_flags.joined
             members = await guild.query_members(username, limit=100, cache=cache)
             return discord.utils.get(members, name=username, discriminator=discriminator)
-        else:
-            for member in members:
-                if argument.lower() in member.name.lower():
-                    return member
-                elif argument.lower() in member.display_name.lower():
-                    return member
-                else:
-                    raise MemberNotFound(argument)
+        cache = guild._state.member_cache_flags.joined
+        members = await guild.query_members(argument, limit=100, cache=cache)
+        lowered = argument.lower()
+        for member in members:
+            if lowered in member.name.lower() or lowered in member.display_name.lower():
+                return member
+        return None
 
 class SearchRole(commands.RoleConverter):
     """A Role Converter to replace 'discord.Role'
     so that users don't have to enter a role's name fully.
     For example a user can input 'Mod' for 'Moderator'.
     Is not case sensitive.
+    Names are looked up in `bot.role_names` (utils.roles).
     """
     async def convert(self, ctx, argument):
         guild = ctx.guild
         if not guild:
             raise NoPrivateMessage()
 
-        match = self._get_id_match(argument.lower()) or re.match(r'<@&([0-9]+)>$', argument.lower())
+        match = self._get_id_match(argument) or re.match(r'<@&([0-9]+)>$', argument)
         if match:
             result = guild.get_role(int(match.group(1)))
         else:
-            result = discord.utils.find(lambda r: r.name.lower() == argument.lower(), guild._roles.values())
+            index = getattr(ctx.bot, 'role_names', None) or RoleIndex()
+            result = index.search(guild, argument)
 
         if result is None:
-            roles = guild._roles.values()
-            for role in roles:
-                if argument.lower() in role.name.lower():
-                    result = role
-                    if result is None:
-                        raise RoleNotFound(argument)
-        return result
\ No newline at end of file
+            raise RoleNotFound(argument)
+        return result
+
+class Duration(commands.Converter):
+    """A length of time like '10m', '1h30m', '2d' or '1w', as a timedelta."""
+    UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    PART = re.compile(r'(\d+)\s*(weeks?|w|days?|d|hours?|hrs?|h|minutes?|mins?|m|seconds?|secs?|s)(?![a-z])\s*', re.IGNORECASE)
+    MAX = timedelta(days=365)
+
+    async def convert(self, ctx, argument):
+        seconds = 0
+        pos = 0
+        for match in self.PART.finditer(argument):
+            if match.start() != pos:
+                break
+            seconds += int(match.group(1)) * self.UNITS[match.group(2)[0].lower()]
+            pos = match.end()
+        if pos != len(argument) or seconds <= 0:
+            raise commands.BadArgument(f'Could not understand the duration **{argument}**, try something like 10m, 2h or 1d')
+        # Checked before building the timedelta, a big enough one overflows instead
+        if seconds > self.MAX.total_seconds():
+            raise commands.BadArgument('Durations can be a year at most')
+        return timedelta(seconds=seconds)
+
+class When(commands.Converter):
+    """A point in time, either a date like '2024-01-31' (UTC) or how long ago like '7d'."""
+    async def convert(self, ctx, argument):
+        try:
+            return datetime.strptime(argument, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+        try:
+            return discord.utils.utcnow() - await Duration().convert(ctx, argument)
+        except commands.BadArgument:
+            raise commands.BadArgument(f'Could not understand **{argument}**, use a date like 2024-01-31 or a time ago like 7d') from None
@@ -0,0 +1,188 @@
+import asyncio
+import sqlite3
+import time
+import threading
+import queue
+from contextlib import suppress
+from concurrent.futures import ThreadPoolExecutor
+
+class Database:
+    """Async wrapper around SQLite so the cogs never block the event loop.
+
+    Reads run on a small thread pool, each thread owning its own connection
+    and every call getting a fresh cursor. Writes go through one writer
+    thread which drains its queue and commits everything it picked up in a
+    single transaction (group commit), so a burst of writes costs one fsync.
+    """
+    def __init__(self, path, *, readers=4, batch_size=256):
+        self.path = path
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-read')
+        self._writes = queue.SimpleQueue()
+        self._writer = None
+        self._closed = False
+        # Called as on_query(kind, seconds) after every read or write, from the awaiting task
+        self.on_query = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def _reader_conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    async def start(self):
+        if self._writer is not None:
+            return self
+        conn = self._connect()
+        self._writer = threading.Thread(target=self._write_loop, args=(conn,), name='db-write', daemon=True)
+        self._writer.start()
+        return self
+
+    # Reads
+
+    def _read(self, sql, params, size):
+        cur = self._reader_conn().cursor()
+        try:
+            cur.execute(sql, params)
+            if size == 1:
+                return cur.fetchone()
+            return cur.fetchall()
+        finally:
+            cur.close()
+
+    async def _timed(self, kind, fut):
+        if self.on_query is None:
+            return await fut
+        start = time.perf_counter()
+        try:
+            return await fut
+        finally:
+            self.on_query(kind, time.perf_counter() - start)
+
+    async def fetchone(self, sql, params=()):
+        loop = asyncio.get_running_loop()
+        return await self._timed('read', loop.run_in_executor(self._readers, self._read, sql, params, 1))
+
+    async def fetchall(self, sql, params=()):
+        loop = asyncio.get_running_loop()
+        return await self._timed('read', loop.run_in_executor(self._readers, self._read, sql, params, None))
+
+    # Writes
+
+    async def transaction(self, func, *args):
+        """Runs ``func(cursor, *args)`` on the writer thread.
+
+        Everything ``func`` does is atomic, and it shares the commit with
+        whatever other writes were queued alongside it. The return value of
+        ``func`` is handed back to the caller.
+        """
+        if self._writer is None:
+            raise RuntimeError('Database has not been started')
+        if self._closed:
+            raise RuntimeError('Database is closed')
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._writes.put((func, args, loop, fut))
+        return await self._timed('write', fut)
+
+    async def execute(self, sql, params=()):
+        """Runs a single write and returns the number of rows it touched."""
+        return await self.transaction(_execute, sql, params)
+
+    async def executemany(self, sql, seq):
+        return await self.transaction(_executemany, sql, list(seq))
+
+    def _write_loop(self, conn):
+        while True:
+            job = self._writes.get()
+            if job is None:
+                break
+            batch = [job]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    job = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+            self._commit_batch(conn, batch)
+            if stop:
+                break
+        conn.close()
+
+    def _commit_batch(self, conn, batch):
+        results = []
+        cur = conn.cursor()
+        try:
+            cur.execute('BEGIN IMMEDIATE')
+            for func, args, loop, fut in batch:
+                # A savepoint per job so one bad write doesn't roll back the rest of the batch
+                cur.execute('SAVEPOINT job')
+                try:
+                    result = func(cur, *args)
+                except Exception as e:
+                    cur.execute('ROLLBACK TO job')
+                    results.append((loop, fut, None, e))
+                else:
+                    results.append((loop, fut, result, None))
+                cur.execute('RELEASE job')
+            cur.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            results = [(loop, fut, None, e) for func, args, loop, fut in batch]
+        finally:
+            cur.close()
+        for loop, fut, result, exc in results:
+            # The loop can already be gone if the bot is shutting down
+            with suppress(RuntimeError):
+                loop.call_soon_threadsafe(_resolve, fut, result, exc)
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None:
+            self._writes.put(None)
+            await asyncio.to_thread(self._writer.join)
+        # Waits for reads still running, so not on the loop
+        await asyncio.to_thread(self._readers.shutdown, wait=True)
+        await asyncio.to_thread(self._close_connections)
+
+    def _close_connections(self):
+        with self._lock:
+            for conn in self._connections:
+                with suppress(sqlite3.Error):
+                    conn.close()
+            self._connections.clear()
+
+def _execute(cur, sql, params):
+    cur.execute(sql, params)
+    return cur.rowcount
+
+def _executemany(cur, sql, seq):
+    cur.executemany(sql, seq)
+    return cur.rowcount
+
+def _resolve(fut, result, exc):
+    if fut.done():
+        return
+    if exc is not None:
+        fut.set_exception(exc)
+    else:
+        fut.set_result(result)
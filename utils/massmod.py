@@ -0,0 +1,120 @@
+import asyncio
+from contextlib import suppress
+
+import discord
+
+from utils.modlog import log_actions
+
+# discord's bulk ban endpoint takes at most this many users per request
+BULK_BAN_LIMIT = 200
+
+class MassAction:
+    """Kicks or bans a list of members in one go.
+
+    Every target is checked against the role hierarchy before anything is
+    sent, then the DMs and the kicks/bans go out `concurrency` at a time,
+    bans through the bulk ban endpoint when we're allowed to use it. The
+    audit rows are written together at the end.
+    """
+    def __init__(self, ctx, members, action, reason, *, concurrency=5):
+        self.ctx = ctx
+        self.members = list(dict.fromkeys(members))
+        self.action = action
+        self.reason = reason
+        self.concurrency = concurrency
+        self.done = []
+        self.skipped = []
+        self.failed = []
+
+    @property
+    def verb(self):
+        return 'Kicked' if self.action == 'Kick' else 'Banned'
+
+    def check(self, member):
+        ctx = self.ctx
+        name = self.action.lower()
+        if member == ctx.guild.owner:
+            return f'cannot {name} the owner'
+        if ctx.author != ctx.guild.owner and member.top_role >= ctx.author.top_role:
+            return 'check your role position'
+        if member.top_role >= ctx.guild.me.top_role:
+            return 'check my top role position'
+        return None
+
+    async def _dm(self, sem, member):
+        async with sem:
+            with suppress(discord.HTTPException):
+                await member.send(f'{self.verb} from {self.ctx.guild.name} for {self.reason} by {self.ctx.author}')
+
+    async def _act(self, sem, member):
+        audit_reason = f'{self.reason} | {self.ctx.author}'
+        async with sem:
+            try:
+                if self.action == 'Kick':
+                    await member.kick(reason=audit_reason)
+                else:
+                    await member.ban(reason=audit_reason)
+            except discord.HTTPException as e:
+                self.failed.append((member, e.text or str(e.status)))
+            else:
+                self.done.append(member)
+
+    async def _bulk_ban(self, members):
+        audit_reason = f'{self.reason} | {self.ctx.author}'
+        by_id = {member.id: member for member in members}
+        for i in range(0, len(members), BULK_BAN_LIMIT):
+            chunk = members[i:i + BULK_BAN_LIMIT]
+            try:
+                result = await self.ctx.guild.bulk_ban(chunk, reason=audit_reason)
+            except discord.HTTPException as e:
+                self.failed.extend((member, e.text or str(e.status)) for member in chunk)
+                continue
+            self.done.extend(by_id[user.id] for user in result.banned)
+            self.failed.extend((by_id[user.id], 'ban failed') for user in result.failed)
+
+    async def run(self):
+        targets = []
+        for member in self.members:
+            problem = self.check(member)
+            if problem is None:
+                targets.append(member)
+            else:
+                self.skipped.append((member, problem))
+        if not targets:
+            return self
+
+        sem = asyncio.Semaphore(self.concurrency)
+        # DMs first, nobody can read one from a server they've already left
+        await asyncio.gather(*(self._dm(sem, member) for member in targets))
+        me = self.ctx.guild.me.guild_permissions
+        if self.action == 'Ban' and len(targets) > 1 and hasattr(self.ctx.guild, 'bulk_ban') and me.manage_guild:
+            await self._bulk_ban(targets)
+        else:
+            await asyncio.gather(*(self._act(sem, member) for member in targets))
+
+        if self.done:
+            await log_actions(self.ctx.bot.db,
+                [(self.ctx.guild.id, member.id, self.ctx.author.id, self.action, self.reason) for member in self.done])
+        return self
+
+    def summary(self, limit=25):
+        def names(members):
+            shown = ', '.join(member.mention for member in members[:limit])
+            return shown + (f' and {len(members) - limit} more' if len(members) > limit else '')
+
+        def grouped(pairs):
+            by_problem = {}
+            for member, problem in pairs:
+                by_problem.setdefault(problem, []).append(member)
+            return '\n'.join(f'{names(members)} ({problem})' for problem, members in by_problem.items())
+
+        lines = []
+        if self.done:
+            lines.append(f'{self.verb} **{len(self.done)}**: {names(self.done)}')
+        else:
+            lines.append(f'{self.verb} nobody')
+        if self.skipped:
+            lines.append(f'Skipped **{len(self.skipped)}**:\n{grouped(self.skipped)}')
+        if self.failed:
+            lines.append(f'Failed **{len(self.failed)}**:\n{grouped(self.failed)}')
+        return '\n'.join(lines)[:2000]
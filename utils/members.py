@@ -0,0 +1,161 @@
+import asyncio
+import sys
+import traceback
+
+from utils.textindex import NameIndex
+
+# What MemberIndex.search returns for a guild it can't search yet
+NOT_INDEXED = object()
+
+def member_names(member):
+    """The lowercased names a member (or user) can be looked up by."""
+    names = {member.name.lower()}
+    if member.discriminator != '0':
+        names.add(f'{member.name}#{member.discriminator}'.lower())
+    if member.global_name:
+        names.add(member.global_name.lower())
+    if getattr(member, 'nick', None):
+        names.add(member.nick.lower())
+    return names
+
+class GuildMembers:
+    """Username, global name and nickname of every member of one guild, searchable by prefix and substring."""
+    def __init__(self, members=()):
+        self.owners = {}
+        self.by_member = {}
+        for member in members:
+            names = self.by_member[member.id] = member_names(member)
+            for name in names:
+                self.owners.setdefault(name, set()).add(member.id)
+        # Built in one go, adding names one by one is quadratic on big guilds
+        self.names = NameIndex(self.owners)
+
+    def __len__(self):
+        return len(self.by_member)
+
+    def add(self, member):
+        names = member_names(member)
+        if self.by_member.get(member.id) == names:
+            return
+        self.remove(member.id)
+        self.by_member[member.id] = names
+        for name in names:
+            self.owners.setdefault(name, set()).add(member.id)
+            self.names.add(name)
+
+    def remove(self, member_id):
+        for name in self.by_member.pop(member_id, ()):
+            ids = self.owners[name]
+            ids.discard(member_id)
+            if not ids:
+                del self.owners[name]
+                self.names.discard(name)
+
+    def find(self, query, limit=25):
+        """Ids of members with a name equal to, starting with or containing `query`, best first."""
+        query = query.lower()
+        names = []
+        if query in self.names:
+            names.append(query)
+        names += self.names.prefix(query, limit)
+        names += self.names.substring(query, limit)
+        seen = set()
+        for name in names:
+            for member_id in sorted(self.owners.get(name, ())):
+                if member_id not in seen:
+                    seen.add(member_id)
+                    yield member_id
+
+class MemberIndex:
+    """Per guild member name indexes for SearchMember.
+
+    A guild is indexed the first time it is searched, as long as its member
+    cache is complete. The index is built in a thread from a snapshot of the
+    member list, member events that arrive meanwhile are replayed onto it,
+    and from then on the events keep it up to date. Until it's ready lookups
+    fall back to the cache and the gateway.
+    """
+    def __init__(self):
+        self.guilds = {}
+        # guild_id -> member changes seen while that guild's index is being built
+        self._building = {}
+        self._tasks = set()
+
+    def get(self, guild):
+        index = self.guilds.get(guild.id)
+        if index is None and guild.chunked and guild.id not in self._building:
+            changes = self._building[guild.id] = []
+            task = asyncio.create_task(self._build(guild, changes))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return index
+
+    async def _build(self, guild, changes):
+        try:
+            index = await asyncio.to_thread(_index_members, guild.members)
+        except Exception:
+            print(f'Failed to index the members of guild {guild.id}:', file=sys.stderr)
+            traceback.print_exc()
+            return
+        finally:
+            # Dropped while we were at it
+            dropped = self._building.get(guild.id) is not changes
+            if not dropped:
+                del self._building[guild.id]
+        if dropped:
+            return
+        for change in changes:
+            if isinstance(change, int):
+                index.remove(change)
+            else:
+                index.add(change)
+        self.guilds[guild.id] = index
+
+    def search(self, guild, query):
+        """The best matching member, None if nobody matches, or NOT_INDEXED if the guild can't be searched locally yet."""
+        index = self.get(guild)
+        if index is None:
+            return NOT_INDEXED
+        for member_id in index.find(query):
+            member = guild.get_member(member_id)
+            if member is not None:
+                return member
+        return None
+
+    def add(self, member):
+        index = self.guilds.get(member.guild.id)
+        if index is not None:
+            index.add(member)
+        elif member.guild.id in self._building:
+            self._building[member.guild.id].append(member)
+
+    def remove(self, guild_id, member_id):
+        index = self.guilds.get(guild_id)
+        if index is not None:
+            index.remove(member_id)
+        elif guild_id in self._building:
+            self._building[guild_id].append(member_id)
+
+    def update_user(self, bot, user):
+        # Username and global name changes come through once, not per guild
+        for guild_id, index in self.guilds.items():
+            if user.id in index.by_member:
+                guild = bot.get_guild(guild_id)
+                member = guild and guild.get_member(user.id)
+                if member is not None:
+                    index.add(member)
+        for guild_id, changes in self._building.items():
+            guild = bot.get_guild(guild_id)
+            member = guild and guild.get_member(user.id)
+            if member is not None:
+                changes.append(member)
+
+    def drop(self, guild_id):
+        self.guilds.pop(guild_id, None)
+        self._building.pop(guild_id, None)
+
+def _index_members(members):
+    # Runs in a thread, so the trigrams SearchMember needs are built here too
+    index = GuildMembers(members)
+    index.names.index_trigrams()
+    return index
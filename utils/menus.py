@@ -1,36 +1,155 @@
+import abc
+import asyncio
 import discord
+from collections import OrderedDict
+from contextlib import suppress
 from discord.ext import menus
 
+class PageSource(abc.ABC):
+    """What MyMenu reads its pages from.
+
+    `get_page(number)` is awaited to render page `number` (starting at 0)
+    into an embed and returns None once `number` is past the last page.
+    `page_count` is the number of pages if known, or None, and `exact` says
+    whether that count can be trusted or is just an estimate.
+    """
+    page_count = None
+    exact = False
+
+    @abc.abstractmethod
+    async def get_page(self, number):
+        ...
+
+class ListPageSource(PageSource):
+    """Pages that were all built up front."""
+    exact = True
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.page_count = len(pages)
+
+    async def get_page(self, number):
+        if 0 <= number < len(self.pages):
+            return self.pages[number]
+        return None
+
+class KeysetPageSource(PageSource):
+    """Pages fetched one at a time with keyset pagination.
+
+    `fetch(after=...)` returns the rows following the given row, or the first
+    rows when it is None, and `format_page(rows, number)` renders them. Only
+    the last row of each page seen is remembered so earlier pages can be
+    fetched again. Pass `exact=True` when `page_count` was counted rather
+    than estimated.
+    """
+    def __init__(self, fetch, format_page, first_page=None, page_count=None, *, exact=False):
+        self.fetch = fetch
+        self.format_page = format_page
+        self.page_count = page_count
+        self.exact = exact
+        self._first_page = first_page
+        self._last_rows = {}
+
+    async def get_page(self, number):
+        if number == 0:
+            rows = self._first_page if self._first_page is not None else await self.fetch()
+        elif number - 1 in self._last_rows:
+            rows = await self.fetch(after=self._last_rows[number - 1])
+        else:
+            return None
+        if not rows:
+            return None
+        self._last_rows[number] = rows[-1]
+        return self.format_page(rows, number)
+
 class MyMenu(menus.Menu):
-    def __init__(self, modules):
-        self.modules = modules
+    """Reaction paginator.
+
+    Takes either a list of embeds or a PageSource. Pages are rendered when
+    first shown, kept in a small LRU, and the next one is rendered in the
+    background while the current one is being read.
+    """
+    def __init__(self, modules, cache_size=5):
+        if isinstance(modules, PageSource):
+            self.source = modules
+        else:
+            self.source = ListPageSource(modules)
+        self.cache_size = cache_size
+        self._pages = OrderedDict()
+        self._rendering = {}
+        # Set once we've found the real end of an unknown or estimated page count
+        self.last_page = self.source.page_count - 1 if self.source.exact and self.source.page_count else None
         super().__init__(timeout=60)
 
+    async def get_page(self, number):
+        if number in self._pages:
+            self._pages.move_to_end(number)
+            return self._pages[number]
+        task = self._rendering.get(number)
+        if task is None:
+            task = self._rendering[number] = asyncio.create_task(self.source.get_page(number))
+        try:
+            page = await asyncio.shield(task)
+        finally:
+            self._rendering.pop(number, None)
+        if page is None:
+            if self.last_page is None or number <= self.last_page:
+                self.last_page = number - 1
+            return None
+        self._pages[number] = page
+        while len(self._pages) > self.cache_size:
+            self._pages.popitem(last=False)
+        return page
+
+    def prefetch(self, number):
+        if number < 0 or number in self._pages or number in self._rendering:
+            return
+        if self.last_page is not None and number > self.last_page:
+            return
+        # Picked up by get_page when the page is actually shown
+        task = self._rendering[number] = asyncio.create_task(self.source.get_page(number))
+        task.add_done_callback(_consume_exception)
+
+    async def show_page(self, number):
+        page = await self.get_page(number)
+        if page is None:
+            return False
+        self.modulenumber = number
+        await self.message.edit(embed=page)
+        self.prefetch(number + 1)
+        return True
+
     async def send_initial_message(self, ctx, channel):
         self.modulenumber=0
-        return await channel.send(embed=self.modules[self.modulenumber])
+        page = await self.get_page(self.modulenumber)
+        message = await channel.send(embed=page)
+        self.prefetch(1)
+        return message
 
     @menus.button('\U00002b05')
     async def previous(self, payload):
-        if self.modulenumber == 0:
-            self.modulenumber=len(self.modules) - 1
-        else:
-            self.modulenumber -= 1
-        await self.message.edit(embed=self.modules[self.modulenumber])
+        if self.modulenumber > 0:
+            await self.show_page(self.modulenumber - 1)
+        elif self.last_page is not None and self.last_page > 0:
+            await self.show_page(self.last_page)
 
     @menus.button('\U000023f9')
     async def cancel(self, payload):
-        await self.message.clear_reactions()
+        # Not allowed in DMs, where tag listings go
+        with suppress(discord.HTTPException):
+            await self.message.clear_reactions()
         self.stop()
 
     @menus.button('\U000027a1')
     async def next(self, payload):
-        if self.modulenumber == len(self.modules) - 1:
-            self.modulenumber=0
-        else:
-            self.modulenumber += 1
-        await self.message.edit(embed=self.modules[self.modulenumber])
+        if not await self.show_page(self.modulenumber + 1) and self.modulenumber != 0:
+            await self.show_page(0)
 
     @menus.button('\N{WASTEBASKET}')
     async def delete(self, payload):
-        await self.message.delete()
\ No newline at end of file
+        await self.message.delete()
+
+def _consume_exception(task):
+    # A prefetch nobody ended up looking at shouldn't log "exception never retrieved"
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,208 @@
+import bisect
+import contextvars
+import math
+import time
+from collections import defaultdict
+
+import aiohttp
+from aiohttp import web
+
+# Histogram bucket upper bounds in seconds, the usual Prometheus ones
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """Estimated from the buckets, assuming values are spread evenly within one."""
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for upper, n in zip(BUCKETS + (math.inf,), self.counts):
+            if n and seen + n >= rank:
+                if upper == math.inf:
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+            lower = upper
+        return 0.0
+
+class CommandStats:
+    __slots__ = ('latency', 'errors', 'db', 'http')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = defaultdict(int)
+        self.db = 0.0
+        self.http = 0.0
+
+class Invocation:
+    __slots__ = ('ctx', 'start', 'db', 'http', 'done')
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.start = time.perf_counter()
+        self.db = 0.0
+        self.http = 0.0
+        self.done = False
+
+# The command the current task is running, if any. Tasks it starts inherit it,
+# anything they do after the command has finished isn't charged to it.
+current = contextvars.ContextVar('current_invocation', default=None)
+
+class Metrics:
+    """Per-command latency, errors, and the time commands spend waiting on the db and HTTP.
+
+    Commands are timed between the bot's before and after invoke hooks (so
+    after argument conversion). The db reports every call through
+    `Database.on_query` and HTTP goes through aiohttp trace configs, both
+    for Discord's REST API and `bot.session`. Each of those is charged to the
+    command running in the calling task as well as going into an overall
+    histogram. Everything is plain counters, cheap enough to leave on.
+
+    `serve` exposes it all in Prometheus' text format on /metrics.
+    """
+    def __init__(self):
+        self.commands = defaultdict(CommandStats)
+        self.db = defaultdict(Histogram)
+        self.http = defaultdict(Histogram)
+        self.started = time.time()
+        # Anything else worth exporting, callables returning more exposition lines
+        self.collectors = []
+        self._runner = None
+
+    # Commands
+
+    async def before_invoke(self, ctx):
+        # A group's hooks run before its subcommand's, it's all one invocation
+        invocation = current.get()
+        if invocation is None or invocation.ctx is not ctx:
+            current.set(Invocation(ctx))
+
+    async def after_invoke(self, ctx):
+        # Only once the innermost subcommand is done
+        if ctx.invoked_subcommand is None or ctx.command is ctx.invoked_subcommand:
+            self.finish(ctx)
+
+    def finish(self, ctx):
+        invocation = current.get()
+        if invocation is None or invocation.ctx is not ctx or invocation.done:
+            return
+        invocation.done = True
+        stats = self.commands[ctx.command.qualified_name]
+        stats.latency.observe(time.perf_counter() - invocation.start)
+        stats.db += invocation.db
+        stats.http += invocation.http
+
+    def error(self, ctx, error):
+        if ctx.command is None:
+            return
+        # Checks and converters fail before the hooks run, those only count as errors
+        self.finish(ctx)
+        self.commands[ctx.command.qualified_name].errors[type(error).__name__] += 1
+
+    # Waiting
+
+    def observe_db(self, kind, seconds):
+        self.db[kind].observe(seconds)
+        invocation = current.get()
+        if invocation is not None and not invocation.done:
+            invocation.db += seconds
+
+    def observe_http(self, target, seconds):
+        self.http[target].observe(seconds)
+        invocation = current.get()
+        if invocation is not None and not invocation.done:
+            invocation.http += seconds
+
+    def http_trace(self, target):
+        """A TraceConfig for a client session, its requests go under `target`."""
+        trace = aiohttp.TraceConfig()
+
+        async def start(session, ctx, params):
+            ctx.start = time.perf_counter()
+
+        async def end(session, ctx, params):
+            self.observe_http(target, time.perf_counter() - ctx.start)
+
+        trace.on_request_start.append(start)
+        trace.on_request_end.append(end)
+        trace.on_request_exception.append(end)
+        return trace
+
+    # Exposition
+
+    def render(self):
+        lines = []
+        render_histogram(lines, 'mollie_command_duration_seconds', 'Time from the before invoke hook to the after one.',
+            'command', {name: stats.latency for name, stats in self.commands.items()})
+        render_counter(lines, 'mollie_command_errors_total', 'Commands that raised, by exception type.',
+            [((('command', name), ('error', error)), n) for name, stats in sorted(self.commands.items())
+                for error, n in sorted(stats.errors.items())])
+        render_counter(lines, 'mollie_command_db_seconds_total', 'Time commands spent waiting on the database.',
+            [((('command', name),), stats.db) for name, stats in sorted(self.commands.items())])
+        render_counter(lines, 'mollie_command_http_seconds_total', 'Time commands spent waiting on HTTP requests.',
+            [((('command', name),), stats.http) for name, stats in sorted(self.commands.items())])
+        render_histogram(lines, 'mollie_db_duration_seconds', 'Database calls, including the wait for a thread.', 'kind', self.db)
+        render_histogram(lines, 'mollie_http_request_duration_seconds', 'Outgoing HTTP requests.', 'target', self.http)
+        lines.append('# HELP mollie_start_time_seconds When the metrics started counting.')
+        lines.append('# TYPE mollie_start_time_seconds gauge')
+        lines.append(f'mollie_start_time_seconds {self.started}')
+        for collector in self.collectors:
+            lines += collector()
+        return '\n'.join(lines) + '\n'
+
+    async def _handle(self, request):
+        return web.Response(body=self.render().encode('utf-8'),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    async def serve(self, host, port):
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+def render_histogram(lines, name, help, label, histograms):
+    """Appends `histograms` ({label value: Histogram}) in the text format, `label` None for a single unlabelled one."""
+    lines.append(f'# HELP {name} {help}')
+    lines.append(f'# TYPE {name} histogram')
+    for value, h in sorted(histograms.items()):
+        labels = f'{label}="{_escape(value)}",' if label is not None else ''
+        total = 0
+        for bound, n in zip(BUCKETS, h.counts):
+            total += n
+            lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {total}')
+        total += h.counts[-1]
+        lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {total}')
+        labels = labels.rstrip(',')
+        lines.append(f'{name}_sum{{{labels}}} {h.sum}' if labels else f'{name}_sum {h.sum}')
+        lines.append(f'{name}_count{{{labels}}} {total}' if labels else f'{name}_count {total}')
+
+def render_counter(lines, name, help, samples):
+    """Appends `samples`, [(((label, value), ...), number)], in the text format."""
+    lines.append(f'# HELP {name} {help}')
+    lines.append(f'# TYPE {name} counter')
+    for labels, value in samples:
+        labels = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+        lines.append(f'{name}{{{labels}}} {value}')
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
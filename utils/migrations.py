@@ -0,0 +1,226 @@
+import time
+
+from utils.modlog import rebuild_mod_stats
+
+# Rows copied per step when a migration rebuilds a table
+BACKFILL_BATCH = 5000
+
+def _columns(cur, table):
+    return [row[1] for row in cur.execute(f"PRAGMA table_info({table})")]
+
+def _backfill(cur, source, columns, sql, keep=None):
+    """Copies `source` into another table in rowid order, one batch at a time.
+
+    Every batch of `columns` is passed through `sql` with executemany, so the
+    insert's ON CONFLICT clause decides how duplicates are merged. Rows that
+    `keep` returns False for are skipped.
+
+    Batching only keeps memory flat. It all still happens inside the
+    migration's transaction, before the bot logs in, so a big table holds up
+    startup for as long as the copy takes. That's on purpose: the cogs only
+    know the new schema, and a half copied table must never be committed.
+    """
+    last = 0
+    while True:
+        rows = cur.execute(f"SELECT rowid, {columns} FROM {source} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (last, BACKFILL_BATCH)).fetchall()
+        if not rows:
+            break
+        last = rows[-1][0]
+        cur.executemany(sql, [row[1:] for row in rows if keep is None or keep(row[1:])])
+
+def _legacy_tables(cur):
+    # What main.py and the cogs used to create on startup
+    cur.execute("CREATE TABLE IF NOT EXISTS guild_settings(guild_id, prefix)")
+    cur.execute("CREATE TABLE IF NOT EXISTS tags(guild_id, author_id, uses, name, content, creation)")
+    cur.execute("CREATE TABLE IF NOT EXISTS warnings(guild_id, user_id, mod_id, mod_type, reason, date)")
+
+def _typed_tables(cur):
+    cur.execute('''CREATE TABLE guild_settings_new(
+        guild_id INTEGER PRIMARY KEY,
+        prefix TEXT,
+        muterole INTEGER
+    )''')
+    muterole = 'muterole' if 'muterole' in _columns(cur, 'guild_settings') else 'NULL'
+    _backfill(cur, 'guild_settings', f'guild_id, prefix, {muterole}',
+        '''INSERT INTO guild_settings_new(guild_id, prefix, muterole) VALUES(?,?,?)
+        ON CONFLICT(guild_id) DO UPDATE SET
+            prefix=COALESCE(excluded.prefix, prefix),
+            muterole=COALESCE(excluded.muterole, muterole)''',
+        keep=lambda row: row[0] is not None)
+
+    # Tags were looked up by lowercase name but created with whatever case was typed,
+    # so names are normalised here and duplicates are merged into the oldest row.
+    cur.execute('''CREATE TABLE tags_new(
+        guild_id INTEGER NOT NULL,
+        author_id INTEGER NOT NULL,
+        uses INTEGER NOT NULL DEFAULT 0,
+        name TEXT NOT NULL,
+        content TEXT NOT NULL,
+        creation TEXT,
+        PRIMARY KEY (guild_id, name)
+    )''')
+    _backfill(cur, 'tags', 'guild_id, author_id, uses, name, content, creation',
+        '''INSERT INTO tags_new(guild_id, author_id, uses, name, content, creation)
+        VALUES(?, ?, COALESCE(?, 0), LOWER(TRIM(?)), ?, ?)
+        ON CONFLICT(guild_id, name) DO UPDATE SET uses = uses + excluded.uses''',
+        keep=lambda row: None not in (row[0], row[1], row[3], row[4]))
+
+    cur.execute('''CREATE TABLE warnings_new(
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        mod_id INTEGER NOT NULL,
+        mod_type TEXT NOT NULL,
+        reason TEXT,
+        date TEXT
+    )''')
+    _backfill(cur, 'warnings', 'guild_id, user_id, mod_id, mod_type, reason, date',
+        'INSERT INTO warnings_new VALUES(?,?,?,?,?,?)',
+        keep=lambda row: None not in (row[0], row[1], row[2], row[3]))
+
+    for table in ('guild_settings', 'tags', 'warnings'):
+        cur.execute(f"DROP TABLE {table}")
+        cur.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+    cur.execute("CREATE INDEX tags_guild_author_idx ON tags(guild_id, author_id)")
+    cur.execute("CREATE INDEX warnings_guild_user_date_idx ON warnings(guild_id, user_id, date)")
+
+def _tag_rank_index(cur):
+    # Serves tag rank (COUNT of higher uses) and tag top straight from the index
+    cur.execute("CREATE INDEX tags_guild_uses_idx ON tags(guild_id, uses DESC, name)")
+
+def _tag_search(cur):
+    # Full text search needs a rowid that VACUUM won't renumber, so tags get an explicit id
+    cur.execute('''CREATE TABLE tags_new(
+        guild_id INTEGER NOT NULL,
+        author_id INTEGER NOT NULL,
+        uses INTEGER NOT NULL DEFAULT 0,
+        name TEXT NOT NULL,
+        content TEXT NOT NULL,
+        creation TEXT,
+        id INTEGER PRIMARY KEY,
+        UNIQUE (guild_id, name)
+    )''')
+    cur.execute('''INSERT INTO tags_new(id, guild_id, author_id, uses, name, content, creation)
+        SELECT rowid, guild_id, author_id, uses, name, content, creation FROM tags''')
+    cur.execute("DROP TABLE tags")
+    cur.execute("ALTER TABLE tags_new RENAME TO tags")
+    cur.execute("CREATE INDEX tags_guild_author_idx ON tags(guild_id, author_id)")
+    cur.execute("CREATE INDEX tags_guild_uses_idx ON tags(guild_id, uses DESC, name)")
+    # guild_id is indexed too so a search only ever walks its own guild's matches
+    cur.execute('''CREATE VIRTUAL TABLE tags_fts USING fts5(
+        name, content, guild_id, content='tags', content_rowid='id'
+    )''')
+    rebuild_tag_search(cur)
+
+def rebuild_tag_search(cur):
+    """Bulk (re)indexes every tag's name and content for full text search."""
+    cur.execute("INSERT INTO tags_fts(tags_fts) VALUES('rebuild')")
+
+def _tag_owner_index(cur):
+    # Lets tag mine page through an author's tags in name order without sorting
+    cur.execute("DROP INDEX tags_guild_author_idx")
+    cur.execute("CREATE INDEX tags_guild_author_name_idx ON tags(guild_id, author_id, name)")
+
+def _role_jobs(cur):
+    # Progress of role addall/removeall, so a restart resumes instead of starting over
+    cur.execute('''CREATE TABLE role_jobs(
+        id INTEGER PRIMARY KEY,
+        guild_id INTEGER NOT NULL,
+        role_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        channel_id INTEGER,
+        message_id INTEGER,
+        author_id INTEGER,
+        cursor INTEGER NOT NULL DEFAULT 0,
+        done INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running',
+        created_at INTEGER NOT NULL
+    )''')
+    cur.execute("CREATE INDEX role_jobs_status_idx ON role_jobs(status)")
+
+def _timers(cur):
+    # Pending tempmute/tempban expiries, read back by expiry time
+    cur.execute('''CREATE TABLE timers(
+        id INTEGER PRIMARY KEY,
+        event TEXT NOT NULL,
+        expires INTEGER NOT NULL,
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        data TEXT,
+        created_at INTEGER NOT NULL
+    )''')
+    cur.execute("CREATE INDEX timers_expires_idx ON timers(expires)")
+    cur.execute("CREATE INDEX timers_member_idx ON timers(guild_id, user_id, event)")
+
+def _warning_timestamps(cur):
+    # date was strftime('%D') (MM/DD/YY), which can't be sorted or range queried.
+    # It becomes seconds since the epoch, midnight UTC of that day, and 0 if it won't parse.
+    cur.execute('''CREATE TABLE warnings_new(
+        id INTEGER PRIMARY KEY,
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        mod_id INTEGER NOT NULL,
+        mod_type TEXT NOT NULL,
+        reason TEXT,
+        created_at INTEGER NOT NULL
+    )''')
+    _backfill(cur, 'warnings', 'guild_id, user_id, mod_id, mod_type, reason, date',
+        '''INSERT INTO warnings_new(guild_id, user_id, mod_id, mod_type, reason, created_at)
+        VALUES(?1, ?2, ?3, ?4, ?5, CASE WHEN ?6 GLOB '[01][0-9]/[0-3][0-9]/[0-9][0-9]'
+            THEN COALESCE(CAST(strftime('%s', '20' || substr(?6, 7, 2) || '-' || substr(?6, 1, 2) || '-' || substr(?6, 4, 2)) AS INTEGER), 0)
+            ELSE 0 END)''')
+    cur.execute("DROP TABLE warnings")
+    cur.execute("ALTER TABLE warnings_new RENAME TO warnings")
+    # Newest first, per member, per moderator and for the whole guild
+    cur.execute("CREATE INDEX warnings_guild_user_created_idx ON warnings(guild_id, user_id, created_at)")
+    cur.execute("CREATE INDEX warnings_guild_mod_created_idx ON warnings(guild_id, mod_id, created_at)")
+    cur.execute("CREATE INDEX warnings_guild_created_idx ON warnings(guild_id, created_at)")
+
+def _mod_stats(cur):
+    # Action counts per moderator, type and day (days since the epoch), kept up to date by utils.modlog
+    cur.execute('''CREATE TABLE mod_stats(
+        guild_id INTEGER NOT NULL,
+        mod_id INTEGER NOT NULL,
+        mod_type TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (guild_id, mod_id, mod_type, day)
+    ) WITHOUT ROWID''')
+    rebuild_mod_stats(cur)
+
+# (version, description, function), append only. Each one runs in its own transaction.
+MIGRATIONS = [
+    (1, 'legacy tables', _legacy_tables),
+    (2, 'typed tables, keys and indexes', _typed_tables),
+    (3, 'tag rank index', _tag_rank_index),
+    (4, 'tag ids and full text search', _tag_search),
+    (5, 'tag owner name index', _tag_owner_index),
+    (6, 'bulk role jobs', _role_jobs),
+    (7, 'timers', _timers),
+    (8, 'warning timestamps', _warning_timestamps),
+    (9, 'mod stats', _mod_stats),
+]
+
+def _apply(cur, version, name, func):
+    func(cur)
+    cur.execute("INSERT INTO schema_version(version, name, applied_at) VALUES(?,?,?)", (version, name, int(time.time())))
+
+async def migrate(db):
+    """Brings the database up to the latest schema version, returns that version."""
+    await db.execute('''CREATE TABLE IF NOT EXISTS schema_version(
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at INTEGER NOT NULL
+    )''')
+    row = await db.fetchone("SELECT MAX(version) FROM schema_version")
+    current = row[0] or 0
+    for version, name, func in MIGRATIONS:
+        if version <= current:
+            continue
+        await db.transaction(_apply, version, name, func)
+        print(f'Applied migration {version}: {name}')
+        current = version
+    return current
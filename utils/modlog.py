@@ -0,0 +1,85 @@
+import time
+
+DAY = 86400
+
+# Above any id or timestamp, the first page's keyset starts below (MAX_ID, MAX_ID)
+MAX_ID = 2 ** 63 - 1
+
+async def log_action(db, guild_id, user_id, mod_id, mod_type, reason):
+    """Records one moderation action in `warnings`."""
+    await log_actions(db, [(guild_id, user_id, mod_id, mod_type, reason)])
+
+async def log_actions(db, actions):
+    """Records (guild_id, user_id, mod_id, mod_type, reason) actions in one transaction."""
+    await db.transaction(_insert_actions, actions, int(time.time()))
+
+def _insert_actions(cur, actions, created_at):
+    cur.executemany('''INSERT INTO warnings(guild_id, user_id, mod_id, mod_type, reason, created_at)
+        VALUES(?,?,?,?,?,?)''', [(*action, created_at) for action in actions])
+    # Same transaction, so mod_stats never drifts from the log
+    cur.executemany('''INSERT INTO mod_stats(guild_id, mod_id, mod_type, day, count) VALUES(?,?,?,?,1)
+        ON CONFLICT(guild_id, mod_id, mod_type, day) DO UPDATE SET count = count + 1''',
+        [(guild_id, mod_id, mod_type, created_at // DAY) for guild_id, _, mod_id, mod_type, _ in actions])
+
+def rebuild_mod_stats(cur):
+    """Recomputes every mod_stats counter from the warnings log, returns how many buckets there are."""
+    cur.execute("DELETE FROM mod_stats")
+    cur.execute('''INSERT INTO mod_stats(guild_id, mod_id, mod_type, day, count)
+        SELECT guild_id, mod_id, mod_type, created_at / ?, COUNT(*) FROM warnings
+        GROUP BY guild_id, mod_id, mod_type, created_at / ?''', (DAY, DAY))
+    return cur.execute("SELECT COUNT(*) FROM mod_stats").fetchone()[0]
+
+async def mod_stats(db, guild_id, mod_id=None, windows=(1, 7, 30)):
+    """Action counts by type over the last `windows` UTC days (today being 1) and all time, from the daily buckets.
+
+    Returns [(mod_type, count per window..., all time)], most common first.
+    """
+    today = int(time.time()) // DAY
+    columns = ', '.join('SUM(CASE WHEN day > ? THEN count ELSE 0 END)' for _ in windows)
+    where = 'guild_id=?' + (' AND mod_id=?' if mod_id is not None else '')
+    params = [today - days for days in windows] + [guild_id] + ([mod_id] if mod_id is not None else [])
+    return await db.fetchall(f'''SELECT mod_type, {columns}, SUM(count) FROM mod_stats
+        WHERE {where} GROUP BY mod_type ORDER BY SUM(count) DESC''', params)
+
+async def top_moderators(db, guild_id, days=30, limit=5):
+    since = int(time.time()) // DAY - days
+    return await db.fetchall('''SELECT mod_id, SUM(count) FROM mod_stats WHERE guild_id=? AND day > ?
+        GROUP BY mod_id ORDER BY SUM(count) DESC LIMIT ?''', (guild_id, since, limit))
+
+def _filters(guild_id, user_id=None, mod_id=None, mod_type=None, after=None, before=None):
+    where = ['guild_id=?']
+    params = [guild_id]
+    for column, value in (('user_id', user_id), ('mod_id', mod_id), ('mod_type', mod_type)):
+        if value is not None:
+            where.append(f'{column}=?')
+            params.append(value)
+    if after is not None:
+        where.append('created_at >= ?')
+        params.append(int(after))
+    if before is not None:
+        where.append('created_at < ?')
+        params.append(int(before))
+    return ' AND '.join(where), params
+
+def history_pager(db, guild_id, *, page_size=10, **filters):
+    """A `fetch(after=None)` for KeysetPageSource over a guild's mod log, newest first.
+
+    Filters are user_id, mod_id, mod_type and an after/before timestamp range.
+    Pages are keyed on (created_at, id), which the indexes on warnings
+    already hold in order, so every page is one index range scan.
+    """
+    where, params = _filters(guild_id, **filters)
+    sql = f'''SELECT id, user_id, mod_id, mod_type, reason, created_at FROM warnings
+        WHERE {where} AND (created_at, id) < (?, ?)
+        ORDER BY created_at DESC, id DESC LIMIT ?'''
+
+    async def fetch(after=None):
+        key = (after[5], after[0]) if after is not None else (MAX_ID, MAX_ID)
+        return await db.fetchall(sql, (*params, *key, page_size))
+    return fetch
+
+async def count_history(db, guild_id, **filters):
+    """How many rows history_pager pages through with the same filters."""
+    where, params = _filters(guild_id, **filters)
+    row = await db.fetchone(f"SELECT COUNT(*) FROM warnings WHERE {where}", params)
+    return row[0]
@@ -0,0 +1,89 @@
+import asyncio
+import sys
+
+import discord
+
+# What a fresh Muted role gets denied in every channel
+MUTED_OVERWRITE = discord.PermissionOverwrite(
+    send_messages=False,
+    send_messages_in_threads=False,
+    create_public_threads=False,
+    create_private_threads=False,
+    add_reactions=False,
+    speak=False,
+)
+
+class MuteRoles:
+    """Works out each guild's mute role once and remembers it.
+
+    The saved `guild_settings.muterole` wins, then a role called Muted, and
+    failing both a new Muted role is created and denied in every channel.
+    Concurrent callers for the same guild wait on the same resolution, so a
+    guild only ever gets one new role. Channels the new role couldn't be
+    denied in are counted in `unapplied` until `pop_unapplied` reports them.
+    """
+    def __init__(self, bot, *, concurrency=5):
+        self.bot = bot
+        self.db = bot.db
+        self.concurrency = concurrency
+        self.roles = {}
+        self.unapplied = {}
+        self._resolving = {}
+
+    async def get(self, guild):
+        role = self.roles.get(guild.id)
+        if role is not None:
+            # A role we just created may not be in the guild's cache yet
+            return guild.get_role(role.id) or role
+        task = self._resolving.get(guild.id)
+        if task is None:
+            task = self._resolving[guild.id] = asyncio.create_task(self._resolve(guild))
+            task.add_done_callback(lambda _: self._resolving.pop(guild.id, None))
+        return await asyncio.shield(task)
+
+    async def _resolve(self, guild):
+        row = await self.db.fetchone("SELECT muterole FROM guild_settings WHERE guild_id=?", (guild.id,))
+        role = guild.get_role(row[0]) if row and row[0] else None
+        if role is None:
+            # Only an exact name, not whatever role happens to contain "muted"
+            role_id = self.bot.role_names.get(guild).exact.get('muted')
+            role = guild.get_role(role_id) if role_id else None
+            if role is None:
+                role = await guild.create_role(name='Muted', reason='Bot Muted Role')
+                failed = await self.apply_overwrites(role)
+                if failed:
+                    print(f'Muted role {role.id} could not be denied in {failed} channels of guild {guild.id}', file=sys.stderr)
+                    self.unapplied[guild.id] = failed
+            await self.save(role)
+        self.roles[guild.id] = role
+        return role
+
+    async def apply_overwrites(self, role):
+        """Denies `role` in every channel at once, returns how many channels couldn't be edited."""
+        sem = asyncio.Semaphore(self.concurrency)
+        failed = 0
+
+        async def deny(channel):
+            nonlocal failed
+            async with sem:
+                try:
+                    await channel.set_permissions(role, overwrite=MUTED_OVERWRITE, reason='Bot Muted Role')
+                except discord.HTTPException:
+                    failed += 1
+
+        await asyncio.gather(*(deny(channel) for channel in role.guild.channels))
+        return failed
+
+    def pop_unapplied(self, guild_id):
+        """How many channels a just created mute role is missing from, once, 0 otherwise."""
+        return self.unapplied.pop(guild_id, 0)
+
+    async def save(self, role):
+        await self.db.execute('''INSERT INTO guild_settings(guild_id, muterole) VALUES(?,?)
+            ON CONFLICT(guild_id) DO UPDATE SET muterole=excluded.muterole''', (role.guild.id, role.id))
+        self.roles[role.guild.id] = role
+
+    def invalidate(self, guild_id, role_id=None):
+        role = self.roles.get(guild_id)
+        if role is not None and (role_id is None or role.id == role_id):
+            del self.roles[guild_id]
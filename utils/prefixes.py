@@ -0,0 +1,35 @@
+class PrefixCache:
+    """Keeps every guild's prefix in memory so `get_prefix` never hits the database.
+
+    The whole table is loaded once at startup, guilds without a row simply get
+    the default prefix, and `set` writes through to the database before
+    updating the map.
+    """
+    def __init__(self, db, default):
+        self.db = db
+        self.default = default
+        self._prefixes = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def load(self):
+        rows = await self.db.fetchall("SELECT guild_id, prefix FROM guild_settings WHERE prefix IS NOT NULL")
+        self._prefixes = {guild_id: prefix for guild_id, prefix in rows}
+
+    def get(self, guild_id):
+        try:
+            prefix = self._prefixes[guild_id]
+        except KeyError:
+            self.misses += 1
+            return self.default
+        self.hits += 1
+        return prefix
+
+    async def set(self, guild_id, prefix):
+        await self.db.execute('''INSERT INTO guild_settings(guild_id, prefix) VALUES(?,?)
+            ON CONFLICT(guild_id) DO UPDATE SET prefix=excluded.prefix''', (guild_id, prefix))
+        self._prefixes[guild_id] = prefix
+
+    @property
+    def stats(self):
+        return {'guilds': len(self._prefixes), 'hits': self.hits, 'misses': self.misses}
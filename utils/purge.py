@@ -0,0 +1,203 @@
+import asyncio
+import multiprocessing
+import re
+import time
+from contextlib import aclosing, suppress
+from datetime import timedelta
+
+import discord
+
+# discord won't bulk delete more than this many messages at once, or anything older than two weeks
+BULK_DELETE_LIMIT = 100
+BULK_DELETE_AGE = timedelta(days=14)
+
+# Longest regex a moderator can purge with
+REGEX_MAX_LENGTH = 100
+
+class CheckTimeout(Exception):
+    pass
+
+def _search(pattern, contents):
+    # re caches compiled patterns, so this only compiles once per worker
+    compiled = re.compile(pattern)
+    return [compiled.search(content) is not None for content in contents]
+
+def _set_result(fut, result, exc):
+    if fut.done():
+        return
+    if exc is not None:
+        fut.set_exception(exc)
+    else:
+        fut.set_result(result)
+
+class RegexWorker:
+    """The process purge regexes are matched in, one for the whole bot.
+
+    A pattern that backtracks catastrophically can't be interrupted in this
+    process, so matching happens in a worker process instead, a page of
+    messages at a time. A page that takes more than `timeout` seconds gets
+    the worker killed and raises CheckTimeout, the next page starts a fresh
+    one. Pages from different purges take turns.
+    """
+    def __init__(self, timeout=1.0):
+        self.timeout = timeout
+        self._pool = None
+        self._lock = asyncio.Lock()
+
+    async def match(self, pattern, contents):
+        """Whether `pattern` is found in each of `contents`."""
+        async with self._lock:
+            if self._pool is None:
+                # Spawning imports a whole interpreter, that's not for the loop to wait on
+                self._pool = await asyncio.to_thread(multiprocessing.get_context('spawn').Pool, 1)
+                # Starting the worker isn't the pattern's fault
+                await self._run('', [], 30)
+            return await self._run(pattern, contents, self.timeout)
+
+    async def _run(self, pattern, contents, timeout):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        # Called on the pool's result thread
+        def resolve(result=None, exc=None):
+            with suppress(RuntimeError):
+                loop.call_soon_threadsafe(_set_result, fut, result, exc)
+
+        self._pool.apply_async(_search, (pattern, contents), callback=resolve, error_callback=lambda e: resolve(exc=e))
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise CheckTimeout() from None
+
+    async def close(self):
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            # terminate() joins the worker and the pool's threads
+            await asyncio.to_thread(pool.terminate)
+
+class RegexCheck:
+    """A page check for Purge, matching message content against a moderator's regex in `worker`."""
+    def __init__(self, worker, pattern):
+        if len(pattern) > REGEX_MAX_LENGTH:
+            raise ValueError(f'Regex is a maximum of {REGEX_MAX_LENGTH} characters')
+        # Invalid patterns fail here, with re.error
+        re.compile(pattern)
+        self.worker = worker
+        self.pattern = pattern
+
+    async def __call__(self, messages):
+        return await self.worker.match(self.pattern, [message.content for message in messages])
+
+class Purge:
+    """Deletes up to `limit` messages from `channel` that pass `check`, newest first.
+
+    At most `scan_limit` messages are looked at and the scan stops at the
+    first message too old to bulk delete. `page_check`, if given, is awaited
+    with each page of scanned messages (up to 100, what one history request
+    returns) and returns whether each one matches, raising CheckTimeout
+    from it stops the scan. Matches are deleted 100 at a time while the
+    scan carries on. `before` and `after` bound the scan like they do for
+    `channel.history`.
+    """
+    def __init__(self, channel, limit, check=None, *, page_check=None, scan_limit=None, before=None, after=None):
+        self.channel = channel
+        self.limit = limit
+        self.check = check
+        self.page_check = page_check
+        self.scan_limit = scan_limit or limit
+        self.before = before
+        self.after = after
+        self.scanned = 0
+        self.deleted = 0
+        self.failed = 0
+        self.stopped = None
+        self.elapsed = 0.0
+
+    async def _delete(self, messages):
+        try:
+            await self.channel.delete_messages(messages)
+        except discord.NotFound:
+            # Some of them were already gone, the rest were still deleted
+            self.deleted += len(messages)
+        except discord.HTTPException:
+            self.failed += len(messages)
+        else:
+            self.deleted += len(messages)
+
+    async def _pages(self, cutoff):
+        page = []
+        seen = 0
+        history = self.channel.history(limit=self.scan_limit, before=self.before, after=self.after, oldest_first=False)
+        async for message in history:
+            if message.created_at < cutoff:
+                self.stopped = 'age'
+                break
+            page.append(message)
+            seen += 1
+            if len(page) == BULK_DELETE_LIMIT:
+                yield page
+                page = []
+        else:
+            self.stopped = 'scan' if seen == self.scan_limit else 'end'
+        if page:
+            yield page
+
+    async def _matches(self, page):
+        if self.page_check is not None:
+            return await self.page_check(page)
+        if self.check is None:
+            return [True] * len(page)
+        return [bool(self.check(message)) for message in page]
+
+    async def run(self):
+        start = time.perf_counter()
+        # A minute of slack so a message doesn't age out between being scanned and deleted
+        cutoff = discord.utils.utcnow() - BULK_DELETE_AGE + timedelta(minutes=1)
+        batch = []
+        matched = 0
+        deleting = None
+        try:
+            async with aclosing(self._pages(cutoff)) as pages:
+                async for page in pages:
+                    try:
+                        matches = await self._matches(page)
+                    except CheckTimeout:
+                        self.stopped = 'timeout'
+                        break
+                    for message, match in zip(page, matches):
+                        self.scanned += 1
+                        if match:
+                            batch.append(message)
+                            matched += 1
+                        if len(batch) == BULK_DELETE_LIMIT:
+                            if deleting is not None:
+                                await deleting
+                            deleting = asyncio.create_task(self._delete(batch))
+                            batch = []
+                        if matched == self.limit:
+                            self.stopped = 'limit'
+                            break
+                    if self.stopped == 'limit':
+                        break
+        finally:
+            if deleting is not None:
+                await deleting
+        if batch:
+            await self._delete(batch)
+        self.elapsed = time.perf_counter() - start
+        return self
+
+    def summary(self):
+        elapsed = max(self.elapsed, 0.001)
+        line = (f'Deleted **{self.deleted}** of **{self.scanned}** scanned messages in {self.elapsed:.1f}s '
+            f'({self.scanned / elapsed:.0f} scanned/s, {self.deleted / elapsed:.0f} deleted/s)')
+        if self.failed:
+            line += f', **{self.failed}** could not be deleted'
+        if self.stopped == 'age':
+            line += '\nStopped at messages older than 14 days, only newer ones can be purged (Discord won\'t bulk delete older messages)'
+        elif self.stopped == 'timeout':
+            line += '\nStopped, the filter took too long on a page of messages'
+        elif self.stopped == 'scan':
+            line += f'\nStopped after scanning {self.scanned} messages'
+        return line
@@ -0,0 +1,48 @@
+class GuildRoles:
+    """One guild's role names, for SearchRole.
+
+    Exact names (lowercased) are a dict lookup. Anything else is ranked:
+    names starting with the query before ones that only contain it, then
+    shorter names, then higher roles.
+    """
+    def __init__(self, roles):
+        self.exact = {}
+        self.names = []
+        # Highest first, so on duplicate names the top role wins
+        for role in sorted(roles, key=lambda r: r.position, reverse=True):
+            name = role.name.lower()
+            self.exact.setdefault(name, role.id)
+            self.names.append((name, role.position, role.id))
+
+    def find(self, query):
+        query = query.lower()
+        role_id = self.exact.get(query)
+        if role_id is not None:
+            return role_id
+        best = None
+        for name, position, role_id in self.names:
+            i = name.find(query)
+            if i == -1:
+                continue
+            key = (i != 0, len(name), -position)
+            if best is None or key < best[0]:
+                best = (key, role_id)
+        return best and best[1]
+
+class RoleIndex:
+    """Per guild role name indexes, built on first use and dropped whenever a role changes."""
+    def __init__(self):
+        self.guilds = {}
+
+    def get(self, guild):
+        index = self.guilds.get(guild.id)
+        if index is None:
+            index = self.guilds[guild.id] = GuildRoles(guild.roles)
+        return index
+
+    def search(self, guild, query):
+        role_id = self.get(guild).find(query)
+        return role_id and guild.get_role(role_id)
+
+    def invalidate(self, guild_id):
+        self.guilds.pop(guild_id, None)
@@ -0,0 +1,74 @@
+import asyncio
+import sys
+import traceback
+from collections import Counter
+
+class TagUseBuffer:
+    """Write-behind buffer for tag view counts.
+
+    Views are counted in memory per (guild_id, name) and written out as one
+    batched transaction every `interval` seconds, or sooner once `max_keys`
+    different tags are waiting. Anything still pending is written on `close`.
+    """
+    def __init__(self, db, *, interval=30.0, max_keys=500):
+        self.db = db
+        self.interval = interval
+        self.max_keys = max_keys
+        self._pending = Counter()
+        self._flushing = Counter()
+        self._lock = asyncio.Lock()
+        # Set once max_keys tags are waiting, wakes the flush loop early
+        self._full = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    def add(self, guild_id, name, amount=1):
+        self._pending[(guild_id, name)] += amount
+        if len(self._pending) >= self.max_keys:
+            self._full.set()
+
+    def pending(self, guild_id, name):
+        key = (guild_id, name)
+        return self._pending.get(key, 0) + self._flushing.get(key, 0)
+
+    def discard(self, guild_id, name):
+        self._pending.pop((guild_id, name), None)
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, Counter()
+            try:
+                await self.db.executemany("UPDATE tags SET uses = uses + ? WHERE guild_id=? AND name=?",
+                    [(amount, guild_id, name) for (guild_id, name), amount in self._flushing.items()])
+            except Exception:
+                # Keep the counts around for the next attempt
+                self._pending.update(self._flushing)
+                raise
+            finally:
+                self._flushing = Counter()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception:
+                print('Failed to flush tag uses:', file=sys.stderr)
+                traceback.print_exc()
+                # Don't let a full buffer retry against a failing db in a tight loop
+                await asyncio.sleep(5)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
@@ -0,0 +1,219 @@
+import asyncio
+import sys
+import traceback
+from bisect import bisect_left, insort
+from collections import Counter
+
+def trigrams(text, pad=True):
+    """The set of three character slices of `text`.
+
+    Padded with spaces by default so the start and end of a word get
+    trigrams of their own and short words still produce some.
+    """
+    if pad:
+        text = f'  {text} '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def edit_distance(a, b, limit=None):
+    """Levenshtein distance between `a` and `b`.
+
+    Gives up early and returns ``limit + 1`` once every path is over `limit`.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb)
+            ))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+def _index(postings, name):
+    for gram in trigrams(name):
+        postings.setdefault(gram, set()).add(name)
+
+def _unindex(postings, name):
+    for gram in trigrams(name):
+        names = postings.get(gram)
+        if names is not None:
+            names.discard(name)
+            if not names:
+                del postings[gram]
+
+def _postings(names):
+    postings = {}
+    for name in names:
+        _index(postings, name)
+    return postings
+
+class NameIndex:
+    """A compact sorted set of names with prefix, substring and fuzzy search.
+
+    Names are kept as one sorted list, so membership and prefix lookups are
+    a binary search. Substring and fuzzy searches narrow things down with a
+    trigram index, which is several times the size of the names themselves,
+    so it only exists once something needs it. `build_trigrams` makes it in a
+    thread, and `drop_trigrams` frees it again. A search on the event loop
+    that finds it missing starts that build and answers from the prefixes
+    in the meantime, off the loop it is built on the spot. While it exists it is updated in place
+    on add and discard, nothing is ever rebuilt.
+    """
+    def __init__(self, names=()):
+        self._names = sorted(set(names))
+        self._trigrams = None
+        # Adds and discards made while a thread is building the trigrams, replayed onto its result
+        self._changes = None
+        self._building = None
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __contains__(self, name):
+        i = bisect_left(self._names, name)
+        return i < len(self._names) and self._names[i] == name
+
+    @property
+    def has_trigrams(self):
+        return self._trigrams is not None
+
+    def index_trigrams(self):
+        """Builds the trigram index right here, for callers already off the event loop."""
+        if self._trigrams is None:
+            self._trigrams = _postings(self._names)
+
+    async def build_trigrams(self):
+        """Builds the trigram index in a thread, names stay usable and changeable meanwhile."""
+        if self._trigrams is not None:
+            return
+        await asyncio.shield(self._start_build())
+
+    def _start_build(self):
+        if self._building is None:
+            self._building = asyncio.ensure_future(self._build())
+            self._building.add_done_callback(_log_build_failure)
+        return self._building
+
+    async def _build(self):
+        self._changes = []
+        try:
+            postings = await asyncio.to_thread(_postings, list(self._names))
+            for added, name in self._changes:
+                (_index if added else _unindex)(postings, name)
+            self._trigrams = postings
+        finally:
+            self._changes = None
+            self._building = None
+
+    def drop_trigrams(self):
+        self._trigrams = None
+
+    def _postings(self):
+        """The trigram index, or None while it's being built for a search on the event loop."""
+        if self._trigrams is None:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                self.index_trigrams()
+            else:
+                self._start_build()
+        return self._trigrams
+
+    def add(self, name):
+        if name not in self:
+            insort(self._names, name)
+            if self._trigrams is not None:
+                _index(self._trigrams, name)
+            if self._changes is not None:
+                self._changes.append((True, name))
+
+    def discard(self, name):
+        i = bisect_left(self._names, name)
+        if i < len(self._names) and self._names[i] == name:
+            del self._names[i]
+            if self._trigrams is not None:
+                _unindex(self._trigrams, name)
+            if self._changes is not None:
+                self._changes.append((False, name))
+
+    def prefix(self, query, limit=None):
+        """Names starting with `query`, in order."""
+        results = []
+        for i in range(bisect_left(self._names, query), len(self._names)):
+            name = self._names[i]
+            if not name.startswith(query) or (limit is not None and len(results) >= limit):
+                break
+            results.append(name)
+        return results
+
+    def substring(self, query, limit=None):
+        """Names containing `query`, shortest first."""
+        grams = trigrams(query, pad=False)
+        if not grams:
+            # Too short to have trigrams of its own
+            return self.prefix(query, limit)
+        index = self._postings()
+        if index is None:
+            return self.prefix(query, limit)
+        postings = sorted((index.get(gram, set()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for names in postings[1:]:
+            candidates &= names
+            if not candidates:
+                break
+        results = sorted((name for name in candidates if query in name), key=lambda n: (len(n), n))
+        return results[:limit] if limit is not None else results
+
+    def fuzzy(self, query, limit=5, max_distance=None, candidates=50):
+        """Names within `max_distance` edits of `query`, closest first.
+
+        Only the `candidates` names sharing the most trigrams with the query
+        are measured.
+        """
+        if max_distance is None:
+            max_distance = max(1, len(query) // 3)
+        index = self._postings()
+        if index is None:
+            return self.prefix(query, limit)
+        shared = Counter()
+        for gram in trigrams(query):
+            shared.update(index.get(gram, ()))
+        scored = []
+        for name, overlap in shared.most_common(candidates):
+            distance = edit_distance(query, name, max_distance)
+            if distance <= max_distance:
+                scored.append((distance, -overlap, name))
+        scored.sort()
+        return [name for _, _, name in scored[:limit]]
+
+    def search(self, query, limit=20):
+        """Exact match, then prefix matches, then substring matches, then close spellings."""
+        results = []
+        seen = set()
+        def extend(names):
+            for name in names:
+                if name not in seen and len(results) < limit:
+                    seen.add(name)
+                    results.append(name)
+        if query in self:
+            extend((query,))
+        extend(self.prefix(query, limit))
+        extend(self.substring(query, limit))
+        extend(self.fuzzy(query, limit))
+        return results
+
+def _log_build_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        print('Failed to build a trigram index:', file=sys.stderr)
+        traceback.print_exception(future.exception())
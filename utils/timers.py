@@ -0,0 +1,140 @@
+import asyncio
+import heapq
+import json
+import sys
+import time
+import traceback
+from typing import NamedTuple, Optional
+
+class Timer(NamedTuple):
+    # expires first so the heap orders by it, id breaks ties
+    expires: int
+    id: int
+    event: str
+    guild_id: int
+    user_id: int
+    data: Optional[str]
+
+    @property
+    def extra(self):
+        return json.loads(self.data) if self.data else {}
+
+class TimerDispatcher:
+    """Durable timers, fired as `on_<event>_timer_complete(timer)` bot events.
+
+    Every timer lives in the `timers` table. Only the ones due within
+    `window` seconds are held in memory, in a heap, and one task sleeps until
+    the earliest of them (or the end of the window, when the next slice gets
+    loaded). Memory stays flat however far ahead timers are booked.
+
+    A timer's row is deleted as it fires. Cancelling just deletes the row,
+    and a heap entry whose row has gone is skipped.
+    """
+    def __init__(self, db, dispatch, *, window=3600):
+        self.db = db
+        self.dispatch = dispatch
+        self.window = window
+        self.horizon = 0
+        self._heap = []
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    async def start(self):
+        if self._task is None:
+            # Overdue timers from while we were offline come in with the first slice
+            await self._load(None, int(time.time()) + self.window)
+            self._task = asyncio.create_task(self._run())
+
+    async def _load(self, after, until):
+        # Moved first, so a timer booked while the query runs is either in it or pushed by create
+        previous, self.horizon = self.horizon, until
+        try:
+            if after is None:
+                rows = await self.db.fetchall('''SELECT expires, id, event, guild_id, user_id, data
+                    FROM timers WHERE expires <= ?''', (until,))
+            else:
+                rows = await self.db.fetchall('''SELECT expires, id, event, guild_id, user_id, data
+                    FROM timers WHERE expires > ? AND expires <= ?''', (after, until))
+        except Exception:
+            self.horizon = previous
+            raise
+        for row in rows:
+            heapq.heappush(self._heap, Timer(*row))
+
+    async def create(self, event, expires, guild_id, user_id, **extra):
+        """Books a timer for `expires` (a UTC timestamp or datetime), returns it."""
+        if not isinstance(expires, (int, float)):
+            expires = expires.timestamp()
+        expires = int(expires)
+        data = json.dumps(extra) if extra else None
+        timer_id = await self.db.transaction(_insert_timer, event, expires, guild_id, user_id, data)
+        timer = Timer(expires, timer_id, event, guild_id, user_id, data)
+        if expires <= self.horizon:
+            first = self._heap[0] if self._heap else None
+            heapq.heappush(self._heap, timer)
+            if first is None or timer < first:
+                self._wake.set()
+        return timer
+
+    async def cancel(self, event, guild_id, user_id):
+        """Drops the pending `event` timers for a member, returns how many there were."""
+        return await self.db.execute("DELETE FROM timers WHERE event=? AND guild_id=? AND user_id=?",
+            (event, guild_id, user_id))
+
+    async def _fire(self, due):
+        # A timer booked while its slice was loading is pushed by both create and _load
+        due = {timer.id: timer for timer in due}
+        # Deleting is how we find out which are still wanted, anything cancelled is already gone
+        fired = await self.db.transaction(_claim_timers, list(due))
+        for timer in due.values():
+            if timer.id in fired:
+                self.dispatch(f'{timer.event}_timer_complete', timer)
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            now = time.time()
+            due = []
+            while self._heap and self._heap[0].expires <= now:
+                due.append(heapq.heappop(self._heap))
+            try:
+                if due:
+                    await self._fire(due)
+                if now >= self.horizon:
+                    await self._load(self.horizon, int(now) + self.window)
+            except Exception:
+                print('Timer dispatch failed:', file=sys.stderr)
+                traceback.print_exc()
+                # Put them back and try again shortly
+                for timer in due:
+                    heapq.heappush(self._heap, timer)
+                await asyncio.sleep(5)
+                continue
+            if due:
+                continue
+            until = min(self._heap[0].expires, self.horizon) if self._heap else self.horizon
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0, until - time.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+def _insert_timer(cur, event, expires, guild_id, user_id, data):
+    cur.execute("INSERT INTO timers(event, expires, guild_id, user_id, data, created_at) VALUES(?,?,?,?,?,?)",
+        (event, expires, guild_id, user_id, data, int(time.time())))
+    return cur.lastrowid
+
+def _claim_timers(cur, ids):
+    fired = set()
+    for timer_id in ids:
+        cur.execute("DELETE FROM timers WHERE id=?", (timer_id,))
+        if cur.rowcount:
+            fired.add(timer_id)
+    return fired
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+
+from utils.metrics import Histogram, render_counter, render_histogram
+
+# Frames from here down count as ours when working out who blocked the loop
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+class Site:
+    __slots__ = ('count', 'total', 'worst', 'stack')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.stack = None
+
+class LoopWatchdog:
+    """Notices when something blocks the event loop and works out what it was.
+
+    A task on the loop wakes every `interval` and records how late it woke
+    (the loop lag). A helper thread keeps an eye on that heartbeat, and once
+    it is well overdue it grabs the loop thread's stack while the culprit is
+    still running. Stalls of `threshold` or more are the ones counted. When
+    the loop gets going again the stall is charged to the innermost frame of
+    ours in that stack (a sync db call, a loop over every member...) and
+    logged, with the stack the first time a site shows up. The worst stack
+    per site is kept for the owner command.
+    """
+    def __init__(self, *, threshold=0.1, interval=0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self.lag = Histogram()
+        self.sites = {}
+        self.stalls = 0
+        self._beat = None
+        self._captured = None
+        self._thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._thread_id = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    async def _run(self):
+        while True:
+            start = self._beat = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.lag.observe(lag)
+            if lag >= self.threshold:
+                captured = self._captured
+                # Only a stack taken during this beat says anything about this stall
+                stack = captured[1] if captured is not None and captured[0] == start else None
+                self._record(lag, stack)
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 4):
+            beat = self._beat
+            # Caught a little early, the culprit has to still be running when we look
+            overdue = time.perf_counter() - beat - self.interval
+            if overdue < self.threshold / 2:
+                continue
+            captured = self._captured
+            if captured is not None and captured[0] == beat:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self._captured = (beat, callback_stack(frame))
+
+    def _record(self, lag, stack):
+        self.stalls += 1
+        key = call_site(stack) if stack else '<not caught in time>'
+        site = self.sites.get(key)
+        if site is None:
+            site = self.sites[key] = Site()
+        first = site.count == 0
+        site.count += 1
+        site.total += lag
+        if lag > site.worst:
+            site.worst = lag
+            if stack:
+                site.stack = ''.join(traceback.format_list(stack))
+        print(f'Event loop blocked for {lag * 1000:.0f}ms at {key} ({site.count} times so far)', file=sys.stderr)
+        if stack and first:
+            print(site.stack, end='', file=sys.stderr)
+
+    def worst(self, n=10):
+        """[(site, Site)] by total time stalled, most first."""
+        return sorted(self.sites.items(), key=lambda item: item[1].total, reverse=True)[:n]
+
+    def render(self):
+        lines = []
+        render_histogram(lines, 'mollie_loop_lag_seconds', 'How late the watchdog heartbeat woke up.', None, {None: self.lag})
+        render_counter(lines, 'mollie_loop_stalls_total', 'Event loop stalls over the threshold, by blocking call site.',
+            [((('site', key),), site.count) for key, site in sorted(self.sites.items())])
+        render_counter(lines, 'mollie_loop_stall_seconds_total', 'Time the event loop was stalled, by blocking call site.',
+            [((('site', key),), site.total) for key, site in sorted(self.sites.items())])
+        return lines
+
+    async def close(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+def callback_stack(frame):
+    """The stack below whichever loop callback is running, the loop's own frames say nothing."""
+    stack = traceback.extract_stack(frame)
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i].filename.endswith(os.path.join('asyncio', 'events.py')):
+            return stack[i + 1:] or stack
+    return stack
+
+def call_site(stack):
+    """The innermost frame in our own code, or just the innermost one if none of it is ours."""
+    for frame in reversed(stack):
+        filename = frame.filename
+        if filename.startswith(ROOT) and 'site-packages' not in filename and not filename.endswith(os.path.join('utils', 'watchdog.py')):
+            return f'{os.path.relpath(filename, ROOT)}:{frame.lineno} in {frame.name}'
+    frame = stack[-1]
+    return f'{frame.filename}:{frame.lineno} in {frame.name}'